@@ -37,7 +37,10 @@ import datalad_next.patches
 
 # register additional configuration items in datalad-core
 from datalad.support.extensions import register_config
-from datalad.support.constraints import EnsureBool
+from datalad.support.constraints import (
+    EnsureBool,
+    EnsureFloat,
+)
 register_config(
     'datalad.credentials.repeat-secret-entry',
     'Require entering secrets twice for interactive specification?',
@@ -50,6 +53,37 @@ register_config(
     type=EnsureBool(),
     default=True,
     dialog='yesno')
+register_config(
+    'datalad.credentials.cache-ttl',
+    'Credential cache time-to-live',
+    description="Time (in seconds) for which secrets and other credential "
+    "fields retrieved from the keyring are cached within a process. "
+    "Changes made via DataLad invalidate the cache immediately. "
+    "A value of 0 disables caching.",
+    type=EnsureFloat(),
+    default=60.0,
+    dialog='question')
+register_config(
+    'datalad.credentials.cache-daemon',
+    'Use a credential cache daemon?',
+    description="If enabled, credential fields retrieved from the keyring "
+    "are kept in memory by a daemon process that is shared by all DataLad "
+    "processes of a user, and is started on demand. This avoids repeated "
+    "keyring access by many parallel processes, e.g. git-annex special "
+    "remotes or Git remote helpers. The daemon listens on a Unix socket "
+    "in a user-only directory in 'datalad.locations.sockets'.",
+    type=EnsureBool(),
+    default=False,
+    dialog='yesno')
+register_config(
+    'datalad.credentials.cache-daemon-timeout',
+    'Credential cache daemon timeout',
+    description="Time (in seconds) for which the credential cache daemon "
+    "keeps a credential field. The daemon exits when its cache is empty, "
+    "and it was idle for this time.",
+    type=EnsureFloat(),
+    default=900.0,
+    dialog='question')
 register_config(
     'datalad.clone.url-substitute.webdav',
     'webdav(s):// clone URL substitution',
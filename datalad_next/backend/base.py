@@ -6,6 +6,7 @@
 """Interface and essential utilities to implement external git-annex backends
 """
 
+import json
 import logging
 
 from abc import (
@@ -13,9 +14,31 @@ from abc import (
     abstractmethod,
 )
 
+from concurrent.futures import ProcessPoolExecutor
+import os
+import queue
+import sqlite3
 import sys
+import threading
+import time
 import traceback
 
+lgr = logging.getLogger('datalad.backend')
+
+# name of the environment variable with the path of a verification cache
+verification_cache_envvar = 'DATALAD_BACKEND_VERIFICATION_CACHE'
+# name of the environment variable with the path of a key index
+key_index_envvar = 'DATALAD_BACKEND_KEY_INDEX'
+# name of the environment variable with the number of parallel key
+# generation jobs
+jobs_envvar = 'DATALAD_BACKEND_JOBS'
+# name of the environment variable with the path of a file to append
+# request metrics to
+metrics_envvar = 'DATALAD_BACKEND_METRICS'
+
+# marker for a request that still needs to be read
+_fetch_next = object()
+
 
 class Backend(metaclass=ABCMeta):
     """Metaclass for backends.
@@ -130,6 +153,23 @@ class Backend(metaclass=ABCMeta):
         self.annex.error("Error received. Exiting.")
         raise SystemExit
 
+    def get_parallel_gen_key(self):
+        """Returns a callable for key generation in a worker process
+
+        This is optional. If a backend returns a callable, `Master` can
+        generate keys for multiple queued GENKEY requests in parallel
+        worker processes (see `Master.jobs`). The callable must be
+        picklable (e.g., a module-level function, or a
+        ``functools.partial`` of one), take a file path as the sole argument,
+        and behave like `gen_key()`, but without progress reporting.
+
+        Returns
+        -------
+        callable or None
+          None, if parallel key generation is not supported (default).
+        """
+        return None
+
 
 # Exceptions
 class AnnexError(Exception):
@@ -169,6 +209,242 @@ class NotLinkedError(AnnexError):
     """
 
 
+class _FileRecordStore(object):
+    """Base class for persistent, bounded SQLite tables of file records
+
+    Records are identified by the device, inode, size, and modification time
+    (in nanoseconds) of a file. Any change to a file invalidates its records.
+    The number of records is bounded, the oldest records are discarded
+    first. Any failure to access the database is not fatal, but causes a
+    cache miss.
+    """
+    # name of the table, and its column definitions (in addition to the
+    # file record columns), set by subclasses
+    _table = None
+    _columns = None
+    _primary_key = None
+
+    def __init__(self, path, maxsize=100000):
+        """
+        Parameters
+        ----------
+        path : str or Path
+            Location of the SQLite database. It is created if it does not
+            exist.
+        maxsize : int
+            Maximum number of records.
+        """
+        self.path = str(path)
+        self.maxsize = maxsize
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute(
+                f'CREATE TABLE IF NOT EXISTS {self._table} ('
+                'dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, '
+                f'{self._columns}, PRIMARY KEY ({self._primary_key}))')
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _query(self, sql, path, *args):
+        try:
+            return self.db.execute(
+                sql, _get_file_record(path) + args).fetchone()
+        except (OSError, sqlite3.Error) as e:
+            lgr.debug('%s lookup failed: %s', self.__class__.__name__, e)
+            return None
+
+    def _insert(self, path, *args):
+        try:
+            record = _get_file_record(path)
+            if time.time_ns() - record[3] < 2 * 10 ** 9:
+                # the file was modified just now, a subsequent modification
+                # might not change the modification time. Do not trust it
+                return
+            db = self.db
+            # REPLACE assigns a new rowid, hence keeps recently used
+            # records from being evicted first
+            db.execute(
+                f'INSERT OR REPLACE INTO {self._table} VALUES '
+                f'({", ".join("?" * (len(record) + len(args)))})',
+                record + args)
+            db.execute(
+                f'DELETE FROM {self._table} WHERE rowid <= '
+                f'(SELECT max(rowid) FROM {self._table}) - ?',
+                (self.maxsize,))
+            db.commit()
+        except (OSError, sqlite3.Error) as e:
+            lgr.debug('%s update failed: %s', self.__class__.__name__, e)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class VerificationCache(_FileRecordStore):
+    """Persistent cache of successful key content verifications
+
+    Records are identified by a file's properties (see `_FileRecordStore`),
+    plus the key its content was verified against. Only successful
+    verifications are recorded.
+    """
+    _table = 'verified'
+    _columns = 'key TEXT'
+    _primary_key = 'dev, ino, size, mtime_ns, key'
+
+    def is_verified(self, key, path):
+        """Returns whether the content of a file is known to match a key"""
+        return self._query(
+            'SELECT 1 FROM verified WHERE dev=? AND ino=? AND size=? '
+            'AND mtime_ns=? AND key=?',
+            path, key) is not None
+
+    def add(self, key, path):
+        """Record that the content of a file was verified to match a key"""
+        self._insert(path, key)
+
+
+class KeyIndex(_FileRecordStore):
+    """Persistent index of keys generated for files
+
+    Maps a file's properties (see `_FileRecordStore`) and the name of a
+    backend to the key generated by this backend for the file's content.
+    Hence, a single index can be shared by multiple backends. This must only
+    be used with backends whose keys are stable (see `Backend.is_stable()`).
+    """
+    _table = 'keys'
+    _columns = 'backend TEXT, key TEXT'
+    _primary_key = 'dev, ino, size, mtime_ns, backend'
+
+    def get(self, path, backend):
+        """Returns the key known for a file and backend name, or None"""
+        res = self._query(
+            'SELECT key FROM keys WHERE dev=? AND ino=? AND size=? '
+            'AND mtime_ns=? AND backend=?',
+            path, backend)
+        return res[0] if res else None
+
+    def add(self, key, path, backend, record=None):
+        """Record the key generated for a file
+
+        Parameters
+        ----------
+        key : str
+        path : str or Path
+        backend : str
+            Name of the backend that generated the key.
+        record : tuple, optional
+            File properties as determined by `get_file_record()` before the
+            key was generated. If given, and the file has changed since, the
+            key is not recorded.
+        """
+        if record is not None:
+            try:
+                if _get_file_record(path) != record:
+                    return
+            except OSError:
+                return
+        self._insert(path, backend, key)
+
+    @staticmethod
+    def get_file_record(path):
+        """Returns the file properties identifying a record, or None"""
+        try:
+            return _get_file_record(path)
+        except OSError:
+            return None
+
+
+def _get_file_record(path):
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def get_verification_cache():
+    """Returns a VerificationCache, if one is configured in the environment
+
+    The cache location is taken from the environment variable
+    ``DATALAD_BACKEND_VERIFICATION_CACHE``.
+
+    Returns
+    -------
+    VerificationCache or None
+    """
+    path = os.environ.get(verification_cache_envvar)
+    return VerificationCache(path) if path else None
+
+
+def get_key_index():
+    """Returns a KeyIndex, if one is configured in the environment
+
+    The index location is taken from the environment variable
+    ``DATALAD_BACKEND_KEY_INDEX``.
+
+    Returns
+    -------
+    KeyIndex or None
+    """
+    path = os.environ.get(key_index_envvar)
+    return KeyIndex(path) if path else None
+
+
+class RequestMetrics(object):
+    """Per-request-type counts, cumulative time, bytes, and failures
+
+    Attributes
+    ----------
+    requests : dict
+        Mapping of request names (e.g. ``GENKEY``) to a dict with the number
+        of requests (``count``), failed requests (``failures``), cumulative
+        processing time in seconds (``time``), and the cumulative size of the
+        files processed in bytes (``bytes``).
+    """
+    def __init__(self):
+        self.requests = {}
+
+    def record(self, request, duration, nbytes=0, failed=False):
+        """Record the processing of a single request
+
+        Parameters
+        ----------
+        request : str
+            Name of the request.
+        duration : float
+            Processing time in seconds.
+        nbytes : int, optional
+            Size of the file processed in bytes.
+        failed : bool, optional
+            Whether the request failed.
+        """
+        m = self.requests.get(request)
+        if m is None:
+            m = self.requests[request] = dict(
+                count=0, failures=0, time=0.0, bytes=0)
+        m['count'] += 1
+        m['time'] += duration
+        m['bytes'] += nbytes
+        if failed:
+            m['failures'] += 1
+
+    def dump(self, path, **kwargs):
+        """Append the metrics as a single JSON line to a file
+
+        Parameters
+        ----------
+        path : str or Path
+        **kwargs
+            Any additional properties to include in the record.
+        """
+        with open(path, 'a') as f:
+            f.write(json.dumps(dict(kwargs, requests=self.requests)))
+            f.write('\n')
+
+
 class Protocol(object):
     """
     Helper class handling the receiving part of the protocol (git-annex to
@@ -176,25 +452,41 @@ class Protocol(object):
     respective method of the backend object.
     """
 
-    def __init__(self, backend):
+    def __init__(self, backend, verification_cache=None, key_index=None):
         self.backend = backend
+        self.verification_cache = verification_cache
+        # an index is only valid for keys that depend on content alone
+        self.key_index = key_index \
+            if key_index is not None and backend.is_stable() else None
+        # keys in the index are specific to a backend
+        self._backend_name = backend.__class__.__name__
         self.version = "VERSION 1"
+        # request name -> handler mapping, to avoid a method lookup
+        # for each request
+        self._handlers = {
+            name[3:]: getattr(self, name)
+            for name in dir(self)
+            if name.startswith('do_')
+        }
 
     def command(self, line):
-        line = line.strip()
-        if not line:
-            raise ProtocolError("Got empty line")
-        parts = line.split(" ", 1)
-
-        method = self.lookupMethod(parts[0])
+        # fast path for well-formed requests, as sent by git-annex
+        request, sep, arg = line.partition(' ')
+        method = self._handlers.get(request)
         if method is None:
-            raise UnsupportedRequest(f'Unknown request {line!r}')
+            line = line.strip()
+            if not line:
+                raise ProtocolError("Got empty line")
+            request, sep, arg = line.partition(' ')
+            method = self.lookupMethod(request)
+            if method is None:
+                raise UnsupportedRequest(f'Unknown request {line!r}')
 
         try:
-            if len(parts) == 1:
-                reply = method()
+            if arg:
+                reply = method(arg)
             else:
-                reply = method(parts[1])
+                reply = method()
         except TypeError as e:
             raise SyntaxError(e)
         else:
@@ -218,17 +510,49 @@ class Protocol(object):
             else 'ISCRYPTOGRAPHICALLYSECURE-NO'
 
     def do_GENKEY(self, *arg):
-        try:
-            key = self.backend.gen_key(arg[0])
-            return f'GENKEY-SUCCESS {key}'
-        except BackendError as e:
-            return f'GENKEY-FAILURE {str(e)}'
+        key, record = self.lookup_key(arg[0])
+        if key is None:
+            try:
+                key = self.backend.gen_key(arg[0])
+            except BackendError as e:
+                return f'GENKEY-FAILURE {str(e)}'
+            self.record_key(key, arg[0], record)
+        return f'GENKEY-SUCCESS {key}'
+
+    def lookup_key(self, local_file):
+        """Looks up the key of a file in the key index, if there is any
+
+        Returns
+        -------
+        (str or None, tuple or None)
+          The key (if known), and the file properties to be passed to
+          `record_key()` after key generation.
+        """
+        index = self.key_index
+        if index is None:
+            return None, None
+        record = index.get_file_record(local_file)
+        return (
+            index.get(local_file, self._backend_name) if record else None
+        ), record
+
+    def record_key(self, key, local_file, record):
+        """Records a generated key in the key index, if there is any"""
+        if self.key_index is not None and record is not None:
+            self.key_index.add(
+                key, local_file, self._backend_name, record)
 
     def do_VERIFYKEYCONTENT(self, *arg):
+        key, content_file = arg[0].split(" ", 1)
+        cache = self.verification_cache
+        if cache is not None and cache.is_verified(key, content_file):
+            return 'VERIFYKEYCONTENT-SUCCESS'
         try:
-            success = self.backend.verify_content(*arg[0].split(" ", 1))
+            success = self.backend.verify_content(key, content_file)
         except BackendError:
             success = False
+        if success and cache is not None:
+            cache.add(key, content_file)
         return 'VERIFYKEYCONTENT-SUCCESS' if success \
             else 'VERIFYKEYCONTENT-FAILURE'
 
@@ -251,9 +575,26 @@ class Master(object):
     backend : Backend
         A class implementing the Backend interface to which this master
         is linked.
+    progress_min_bytes : int
+        Minimum advance (in bytes) since the last progress report, before
+        another report is sent to git-annex.
+    progress_min_interval : float
+        Minimum time (in seconds) since the last progress report, before
+        another report is sent to git-annex. Progress reports are also only
+        flushed to the output, if this much time has passed since the last
+        flush.
+    jobs : int
+        Number of worker processes for parallel key generation.
+    metrics : RequestMetrics or None
+        If set, per-request metrics are recorded. When `Listen()` exits, the
+        metrics are appended to the file given by the environment variable
+        ``DATALAD_BACKEND_METRICS``. This attribute is set automatically, if
+        this variable is set.
     """
+    progress_min_bytes = 1024 * 1024
+    progress_min_interval = 0.2
 
-    def __init__(self, output=sys.stdout):
+    def __init__(self, output=sys.stdout, jobs=None):
         """
         Initialize the Master with an ouput.
 
@@ -262,10 +603,26 @@ class Master(object):
         output : io.TextIOBase
             Where to send replies and backend messages
             Default: sys.stdout
+        jobs : int, optional
+            If larger than 1, and the linked backend supports it (see
+            `Backend.get_parallel_gen_key()`), input is read ahead, and
+            consecutive GENKEY requests that are already queued are processed
+            in parallel by this number of worker processes. Replies are sent
+            in the order of the requests. If not given, the number is taken
+            from the environment variable ``DATALAD_BACKEND_JOBS``, and
+            defaults to 1.
         """
         self.output = output
-
-    def LinkBackend(self, backend):
+        if jobs is None:
+            jobs = int(os.environ.get(jobs_envvar, 1))
+        self.jobs = jobs
+        self.metrics = RequestMetrics() \
+            if os.environ.get(metrics_envvar) else None
+        # time of the last flush of the output
+        self._last_flush = float('-inf')
+        self._reset_progress()
+
+    def LinkBackend(self, backend, verification_cache=None, key_index=None):
         """
         Link the Master to a backend. This must be done before calling Listen()
 
@@ -274,9 +631,17 @@ class Master(object):
         backend : Backend
             A class implementing Backend interface to which this master
             will be linked.
+        verification_cache : VerificationCache, optional
+            If given, successful key content verifications are recorded,
+            and repeated verifications of unchanged files are answered
+            without calling the backend.
+        key_index : KeyIndex, optional
+            If given, and the backend generates stable keys, generated keys
+            are recorded, and key generation for unchanged files is answered
+            without calling the backend.
         """
         self.backend = backend
-        self.protocol = Protocol(backend)
+        self.protocol = Protocol(backend, verification_cache, key_index)
 
     def Listen(self, input=sys.stdin):
         """
@@ -297,24 +662,175 @@ class Master(object):
             raise NotLinkedError("Please execute LinkBackend(backend) first.")
 
         self.input = input
+        gen_key = self.backend.get_parallel_gen_key() \
+            if self.jobs > 1 else None
+        try:
+            if gen_key is not None:
+                self._listen_readahead(gen_key)
+            else:
+                self._listen()
+        finally:
+            self._dump_metrics()
+
+    def _listen(self):
         while True:
             # due to a bug in python 2 we can't use an iterator here: https://bugs.python.org/issue1633941
             line = self.input.readline()
             if not line:
                 break
-            line = line.rstrip()
+            if line[-1] == '\n':
+                # only strip the line terminator, a request argument (file
+                # name) may legitimately end with whitespace
+                line = line[:-1]
+            self._handle_request(line)
+
+    def _handle_request(self, line):
+        # the first progress report for any request is always sent
+        self._reset_progress()
+        start = time.perf_counter()
+        failed = True
+        try:
+            reply = self.protocol.command(line)
+            if reply:
+                # the final progress must not be lost to the throttling
+                self._send_pending_progress()
+                self._send(reply)
+            failed = reply is not None \
+                and reply.partition(' ')[0].endswith('-FAILURE')
+        except UnsupportedRequest as e:
+            self.debug(str(e))
+            self._send("UNSUPPORTED-REQUEST")
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if self.metrics is not None:
+                self._record_metrics(
+                    line, time.perf_counter() - start, failed)
+
+    def _record_metrics(self, line, duration, failed):
+        request, _, arg = line.partition(' ')
+        if request == 'VERIFYKEYCONTENT':
+            # skip the key
+            arg = arg.partition(' ')[2]
+        elif request != 'GENKEY':
+            arg = None
+        nbytes = 0
+        if arg:
             try:
-                reply = self.protocol.command(line)
-                if reply:
-                    self._send(reply)
-            except UnsupportedRequest as e:
-                self.debug(str(e))
-                self._send("UNSUPPORTED-REQUEST")
-            except Exception as e:
-                for line in traceback.format_exc().splitlines():
-                    self.debug(line)
-                self.error(e)
-                raise SystemExit
+                nbytes = os.stat(arg).st_size
+            except OSError:
+                pass
+        self.metrics.record(request, duration, nbytes, failed)
+
+    def _dump_metrics(self):
+        path = os.environ.get(metrics_envvar)
+        if self.metrics is None or not path:
+            return
+        try:
+            self.metrics.dump(
+                path,
+                pid=os.getpid(),
+                backend=self.backend.__class__.__name__,
+            )
+        except OSError as e:
+            lgr.debug('Cannot write backend metrics to %s: %s', path, e)
+
+    def _fail(self, e):
+        for line in traceback.format_exc().splitlines():
+            self.debug(line)
+        self.error(e)
+        raise SystemExit
+
+    def _listen_readahead(self, gen_key):
+        """Listen with read-ahead, and parallel GENKEY processing
+
+        A reader thread puts all input lines into a queue. Whenever a GENKEY
+        request is processed, all immediately following GENKEY requests
+        already in the queue are processed together in a process pool.
+        """
+        lines = queue.Queue()
+
+        def reader():
+            for line in iter(self.input.readline, ''):
+                if line[-1] == '\n':
+                    line = line[:-1]
+                lines.put(line)
+            # signal end of input
+            lines.put(None)
+
+        threading.Thread(target=reader, daemon=True).start()
+        # git-annex typically waits for each reply, hence a batch, and a
+        # process pool, might never be needed
+        pool = None
+        try:
+            line = lines.get()
+            while line is not None:
+                if not line.startswith('GENKEY '):
+                    self._handle_request(line)
+                    line = lines.get()
+                    continue
+                batch = [line]
+                # collect all GENKEY requests that are already queued,
+                # never wait for more, git-annex might wait for a reply
+                while True:
+                    try:
+                        line = lines.get_nowait()
+                    except queue.Empty:
+                        line = _fetch_next
+                        break
+                    if line is None or not line.startswith('GENKEY '):
+                        break
+                    batch.append(line)
+                if len(batch) == 1:
+                    # nothing to parallelize, avoid any overhead
+                    self._handle_request(batch[0])
+                else:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(self.jobs)
+                    self._handle_genkey_batch(pool, gen_key, batch)
+                if line is _fetch_next:
+                    line = lines.get()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _handle_genkey_batch(self, pool, gen_key, batch):
+        protocol = self.protocol
+        start = time.perf_counter()
+        jobs = []
+        for line in batch:
+            path = line[7:]
+            key, record = protocol.lookup_key(path)
+            jobs.append((
+                path,
+                key,
+                record,
+                pool.submit(gen_key, path) if key is None else None,
+            ))
+        try:
+            for path, key, record, f in jobs:
+                failed = False
+                if f is not None:
+                    try:
+                        key = f.result()
+                    except BackendError as e:
+                        failed = True
+                        self._send(f'GENKEY-FAILURE {str(e)}')
+                    else:
+                        protocol.record_key(key, path, record)
+                if not failed:
+                    self._send(f'GENKEY-SUCCESS {key}')
+                if self.metrics is not None:
+                    # with parallel processing, this is the time until the
+                    # reply was sent
+                    self._record_metrics(
+                        f'GENKEY {path}', time.perf_counter() - start,
+                        failed)
+        except Exception as e:
+            for job in jobs:
+                if job[3] is not None:
+                    job[3].cancel()
+            self._fail(e)
 
     def debug(self, *args):
         """
@@ -326,7 +842,8 @@ class Master(object):
             The message to be displayed to the user
         """
 
-        self._send("DEBUG", *args)
+        # no need to flush, git-annex does not wait for this
+        self._send("DEBUG", *args, flush=False)
 
     def error(self, *args):
         """
@@ -350,13 +867,56 @@ class Master(object):
         This is highly recommended for ``*_store()``. (It is optional but good for
         ``*_retrieve()``.)
 
+        Reports are rate-limited: after the first report for a request, a
+        report is only sent when the progress advanced by at least
+        ``progress_min_bytes`` and at least ``progress_min_interval`` seconds
+        have passed since the last report. The last progress that was held
+        back is sent right before the reply to the request. Moreover, reports
+        are buffered, and the output is only flushed, if
+        ``progress_min_interval`` seconds have passed since the last flush.
+        Hence this method can be called from tight read loops.
+
         Parameters
         ----------
         progress : int
             The current progress of the transfer in bytes.
         """
-        self._send("PROGRESS {progress}".format(progress=int(progress)))
-
-    def _send(self, *args, **kwargs):
+        progress = int(progress)
+        last = self._last_progress
+        seen, self._progress_seen = self._progress_seen, progress
+        if last is not None and seen <= progress:
+            if progress - last < self.progress_min_bytes:
+                return
+            now = time.monotonic()
+            if now - self._last_progress_time < self.progress_min_interval:
+                return
+        else:
+            # first report, or progress went backwards (new file)
+            now = time.monotonic()
+        self._send_progress(progress, now)
+
+    def _send_progress(self, progress, now):
+        self._last_progress = progress
+        self._last_progress_time = now
+        self._send(
+            "PROGRESS {progress}".format(progress=progress),
+            flush=now - self._last_flush >= self.progress_min_interval,
+        )
+
+    def _send_pending_progress(self):
+        seen = self._progress_seen
+        if seen is not None and seen != self._last_progress:
+            self._send_progress(seen, time.monotonic())
+
+    def _reset_progress(self):
+        # last reported progress and its time, and last progress seen
+        self._last_progress = None
+        self._last_progress_time = None
+        self._progress_seen = None
+
+    def _send(self, *args, flush=True, **kwargs):
         print(*args, file=self.output, **kwargs)
-        self.output.flush()
+        # unflushed messages go out with the next flushed one, at the latest
+        if flush:
+            self.output.flush()
+            self._last_flush = time.monotonic()
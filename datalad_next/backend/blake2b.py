@@ -0,0 +1,193 @@
+"""git-annex external backend XBLAKE2B256 for high-throughput key generation
+
+Keys are generated from a BLAKE2b hash (256 bit digest) of a file's content,
+and include the file size, e.g.::
+
+    XBLAKE2B256-s1048576--<64-character hexdigest>
+
+Files are read via a memory map (or, if a file cannot be mapped, via large
+sequential reads). Files larger than a single read chunk are hashed on
+a worker thread, while the main thread reports the hashing progress to
+git-annex at a fixed interval. The hash function releases Python's global
+interpreter lock while processing a chunk, hence reading and progress
+reporting do not slow down the hashing.
+
+With ``DATALAD_BACKEND_JOBS`` set to a number larger than 1, GENKEY requests
+that git-annex has already queued are processed in parallel by this number of
+worker processes (see `Master`). With ``DATALAD_BACKEND_KEY_INDEX`` set to
+the path of an index file, keys of unchanged files are looked up instead of
+being computed again (see `KeyIndex`).
+
+To use this backend for a repository, the executable
+``git-annex-backend-XBLAKE2B256`` must be in the ``PATH``, and git-annex
+must be configured to use it, e.g. via ``.gitattributes``::
+
+    * annex.backend=XBLAKE2B256
+"""
+
+from functools import partial
+import hashlib
+import mmap
+import os
+import threading
+
+from .base import (
+    Backend,
+    BackendError,
+    Master,
+    get_key_index,
+    get_verification_cache,
+)
+
+backend_name = 'XBLAKE2B256'
+
+
+class Blake2bBackend(Backend):
+    """Implementation of an external git-annex backend using BLAKE2b
+
+    Keys generated by this backend are stable and cryptographically secure.
+    """
+    # number of bytes passed to the hash function at once, files smaller
+    # than that are hashed in a single step without a worker thread
+    chunk_size = 16 * 1024 * 1024
+    # minimum time (in seconds) between progress reports
+    progress_interval = 0.5
+
+    def can_verify(self):
+        return True
+
+    def is_stable(self):
+        return True
+
+    def is_cryptographically_secure(self):
+        return True
+
+    def gen_key(self, local_file):
+        try:
+            size, digest = self._hash_file(local_file)
+        except OSError as e:
+            raise BackendError(str(e)) from e
+        return _format_key(size, digest)
+
+    def get_parallel_gen_key(self):
+        return partial(_gen_key, chunk_size=self.chunk_size)
+
+    def verify_content(self, key, content_file):
+        keysize = _get_key_size(key)
+        try:
+            if keysize is not None \
+                    and os.stat(content_file).st_size != keysize:
+                # no need to read anything
+                return False
+            size, digest = self._hash_file(content_file)
+        except OSError as e:
+            raise BackendError(str(e)) from e
+        # compare the hash only, a key may have additional fields
+        return key.split('--', 1)[-1] == digest
+
+    def _hash_file(self, path):
+        """Returns size and hexdigest of a file's content"""
+        hasher = _FileHasher(path, self.chunk_size)
+        if hasher.size <= self.chunk_size:
+            # nothing to report progress on
+            hasher.run()
+        else:
+            hasher.start()
+            while True:
+                hasher.join(self.progress_interval)
+                if not hasher.is_alive():
+                    break
+                self.annex.progress(hasher.position)
+        if hasher.error:
+            raise hasher.error
+        return hasher.size, hasher.hexdigest
+
+
+class _FileHasher(threading.Thread):
+    """Compute the BLAKE2b hash of a file, optionally on a separate thread
+
+    The `position` attribute reports the number of bytes processed so far.
+    After completion, the result is available in `hexdigest`, or an
+    exception in `error`.
+    """
+    def __init__(self, path, chunk_size):
+        super().__init__(daemon=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        # raises OSError for unusable paths right away
+        self.size = os.stat(path).st_size
+        self.position = 0
+        self.hexdigest = None
+        self.error = None
+
+    def run(self):
+        try:
+            h = hashlib.blake2b(digest_size=32)
+            with open(self.path, 'rb') as f:
+                try:
+                    self._hash_mmap(h, f)
+                except (ValueError, OSError):
+                    # cannot map, e.g., empty file or unsupported file
+                    # system. Go with plain reads from where we are
+                    self._hash_read(h, f)
+            self.hexdigest = h.hexdigest()
+        except Exception as e:
+            self.error = e
+
+    def _hash_mmap(self, h, f):
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if hasattr(m, 'madvise'):
+                m.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(m) as mv:
+                size = len(mv)
+                while self.position < size:
+                    end = min(self.position + self.chunk_size, size)
+                    h.update(mv[self.position:end])
+                    self.position = end
+
+    def _hash_read(self, h, f):
+        f.seek(self.position)
+        buf = bytearray(self.chunk_size)
+        with memoryview(buf) as mv:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(mv[:n])
+                self.position += n
+
+
+def _format_key(size, digest):
+    return f'{backend_name}-s{size}--{digest}'
+
+
+def _gen_key(local_file, chunk_size):
+    """Key generation without progress reporting, for worker processes"""
+    try:
+        hasher = _FileHasher(local_file, chunk_size)
+        hasher.run()
+        if hasher.error:
+            raise hasher.error
+    except OSError as e:
+        raise BackendError(str(e)) from e
+    return _format_key(hasher.size, hasher.hexdigest)
+
+
+def _get_key_size(key):
+    """Return the size field of a git-annex key, or None if there is none"""
+    for field in key.split('--', 1)[0].split('-')[1:]:
+        if field.startswith('s') and field[1:].isdigit():
+            return int(field[1:])
+    return
+
+
+def main():
+    """Entry point for the backend utility"""
+    master = Master()
+    backend = Blake2bBackend(master)
+    master.LinkBackend(
+        backend,
+        verification_cache=get_verification_cache(),
+        key_index=get_key_index(),
+    )
+    master.Listen()
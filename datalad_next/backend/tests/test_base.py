@@ -1,9 +1,15 @@
+import json
 import logging
 import io
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
 
 from datalad.tests.utils_pytest import (
     assert_raises,
     eq_,
+    with_tempfile,
 )
 from datalad.utils import swallow_outputs
 
@@ -13,7 +19,9 @@ from ..base import (
     NotLinkedError,
     Protocol,
     ProtocolError,
+    KeyIndex,
     UnsupportedRequest,
+    VerificationCache,
 )
 
 
@@ -48,6 +56,30 @@ def test_protocol():
     eq_(p.command('GENKEY for-some-file'), 'GENKEY-FAILURE not worky-worky')
     # and for key verification
     eq_(p.command('VERIFYKEYCONTENT for-some-file mykey'), 'VERIFYKEYCONTENT-FAILURE')
+    # surrounding whitespace and lower-case requests are tolerated
+    eq_(p.command('  getversion \n'), 'VERSION 1')
+
+
+class EchoBackend(FakeBackend):
+    def gen_key(self, val):
+        return f'ECHO--{val}'
+
+
+def test_protocol_dispatch():
+    p = Protocol(EchoBackend())
+    # all request handlers are known upfront
+    for request in ('GETVERSION', 'CANVERIFY', 'ISSTABLE',
+                    'ISCRYPTOGRAPHICALLYSECURE', 'GENKEY',
+                    'VERIFYKEYCONTENT', 'ERROR'):
+        assert request in p._handlers
+    # file names are passed on as-is, including any whitespace
+    eq_(p.command('GENKEY some file '), 'GENKEY-SUCCESS ECHO--some file ')
+    output = io.StringIO()
+    master = Master(output=output)
+    master.LinkBackend(EchoBackend())
+    master.Listen(io.StringIO('GENKEY some file \nGENKEY other\n'))
+    eq_(output.getvalue(),
+        'GENKEY-SUCCESS ECHO--some file \nGENKEY-SUCCESS ECHO--other\n')
 
 
 def test_master():
@@ -67,3 +99,201 @@ def test_master():
         eq_(cmo.out, 'PROGRESS 15\n')
 
 
+def test_master_progress_throttling():
+    output = io.StringIO()
+    master = Master(output=output)
+    master.LinkBackend(FakeBackend())
+    master.progress_min_bytes = 100
+    # no reports based on time
+    master.progress_min_interval = 3600
+    for i in range(1000):
+        master.progress(i)
+    # only the very first report makes it out
+    eq_(output.getvalue(), 'PROGRESS 0\n')
+    # progress going backwards indicates a new file, and is reported
+    master.progress(5)
+    eq_(output.getvalue().splitlines()[-1], 'PROGRESS 5')
+    # no limit by time, only by bytes
+    master.progress_min_interval = 0
+    for i in range(1000):
+        master.progress(i)
+    eq_(output.getvalue().splitlines()[2:],
+        [f'PROGRESS {i}' for i in range(0, 1000, 100)])
+    # any new request also resets the throttling
+    master.Listen(io.StringIO('GETVERSION'))
+    master.progress(999)
+    eq_(output.getvalue().splitlines()[-2:], ['VERSION 1', 'PROGRESS 999'])
+
+
+class ProgressBackend(FakeBackend):
+    def __init__(self, annex):
+        self.annex = annex
+
+    def gen_key(self, val):
+        for i in range(1000):
+            self.annex.progress(i)
+        return 'key'
+
+
+def test_master_final_progress():
+    output = io.StringIO()
+    master = Master(output=output)
+    master.LinkBackend(ProgressBackend(master))
+    master.progress_min_bytes = 100
+    master.progress_min_interval = 3600
+    master.Listen(io.StringIO('GENKEY somefile\n'))
+    # the last progress is always reported, right before the reply
+    eq_(output.getvalue().splitlines(),
+        ['PROGRESS 0', 'PROGRESS 999', 'GENKEY-SUCCESS key'])
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self):
+        self.verified = 0
+
+    def verify_content(self, key, f):
+        self.verified += 1
+        return Path(f).read_text() == key
+
+
+@with_tempfile(mkdir=True)
+def test_verification_cache(path=None):
+    path = Path(path)
+    fpath = path / 'file'
+    fpath.write_text('good')
+    # modification time must not be too recent to be trusted
+    old = time.time() - 100
+    os.utime(fpath, (old, old))
+    backend = CountingBackend()
+    cache = VerificationCache(path / 'cache.sqlite', maxsize=2)
+    p = Protocol(backend, cache)
+    for i in range(2):
+        eq_(p.command(f'VERIFYKEYCONTENT good {fpath}'),
+            'VERIFYKEYCONTENT-SUCCESS')
+    # second verification came from the cache
+    eq_(backend.verified, 1)
+    # failures are not cached
+    for i in range(2):
+        eq_(p.command(f'VERIFYKEYCONTENT bad {fpath}'),
+            'VERIFYKEYCONTENT-FAILURE')
+    eq_(backend.verified, 3)
+    # the cache is persistent
+    cache.close()
+    cache = VerificationCache(path / 'cache.sqlite', maxsize=2)
+    assert cache.is_verified('good', fpath)
+    # any modification invalidates
+    os.utime(fpath, (old + 1, old + 1))
+    assert not cache.is_verified('good', fpath)
+    # a recent modification is not trusted
+    fpath.write_text('good')
+    cache.add('good', fpath)
+    assert not cache.is_verified('good', fpath)
+    os.utime(fpath, (old, old))
+    # bounded size, oldest records go first
+    for key in ('k1', 'k2', 'k3'):
+        cache.add(key, fpath)
+    assert not cache.is_verified('k1', fpath)
+    assert cache.is_verified('k2', fpath)
+    assert cache.is_verified('k3', fpath)
+    # no crash on absent files
+    assert not cache.is_verified('k3', path / 'absent')
+    cache.add('k3', path / 'absent')
+    cache.close()
+
+
+class KeyCountingBackend(CountingBackend):
+    stable = True
+
+    def is_stable(self):
+        return self.stable
+
+    def gen_key(self, f):
+        self.verified += 1
+        try:
+            return f'KEY--{Path(f).read_text()}'
+        except OSError as e:
+            raise BackendError(str(e)) from e
+
+
+class OtherKeyCountingBackend(KeyCountingBackend):
+    def gen_key(self, f):
+        return super().gen_key(f).replace('KEY--', 'OTHER--')
+
+
+@with_tempfile(mkdir=True)
+def test_key_index(path=None):
+    path = Path(path)
+    fpath = path / 'file'
+    fpath.write_text('one')
+    old = time.time() - 100
+    os.utime(fpath, (old, old))
+    backend = KeyCountingBackend()
+    index = KeyIndex(path / 'index.sqlite')
+    p = Protocol(backend, key_index=index)
+    for i in range(2):
+        eq_(p.command(f'GENKEY {fpath}'), 'GENKEY-SUCCESS KEY--one')
+    # second key came from the index
+    eq_(backend.verified, 1)
+    eq_(index.get(fpath, 'KeyCountingBackend'), 'KEY--one')
+    # keys are specific to a backend
+    eq_(index.get(fpath, 'OtherKeyCountingBackend'), None)
+    other = OtherKeyCountingBackend()
+    eq_(Protocol(other, key_index=index).command(f'GENKEY {fpath}'),
+        'GENKEY-SUCCESS OTHER--one')
+    eq_(other.verified, 1)
+    eq_(index.get(fpath, 'KeyCountingBackend'), 'KEY--one')
+    eq_(index.get(fpath, 'OtherKeyCountingBackend'), 'OTHER--one')
+    # any modification invalidates
+    fpath.write_text('two')
+    os.utime(fpath, (old + 1, old + 1))
+    eq_(p.command(f'GENKEY {fpath}'), 'GENKEY-SUCCESS KEY--two')
+    eq_(backend.verified, 2)
+    # a file changed during key generation is not recorded
+    record = index.get_file_record(fpath)
+    os.utime(fpath, (old + 2, old + 2))
+    index.add('KEY--three', fpath, 'KeyCountingBackend', record)
+    eq_(index.get(fpath, 'KeyCountingBackend'), None)
+    # failures are not recorded, and not fatal
+    assert p.command(f'GENKEY {path / "absent"}').startswith(
+        'GENKEY-FAILURE ')
+    # no index with unstable keys
+    backend.stable = False
+    eq_(Protocol(backend, key_index=index).key_index, None)
+    index.close()
+
+
+@with_tempfile(mkdir=True)
+def test_metrics(path=None):
+    path = Path(path)
+    fpath = path / 'file'
+    fpath.write_text('content')
+    metrics_file = path / 'metrics.jsonl'
+    with patch.dict(
+            'os.environ', {'DATALAD_BACKEND_METRICS': str(metrics_file)}):
+        for i in range(2):
+            output = io.StringIO()
+            master = Master(output=output)
+            master.LinkBackend(KeyCountingBackend())
+            master.Listen(io.StringIO(
+                f'GENKEY {fpath}\n'
+                f'GENKEY {fpath}\n'
+                f'GENKEY {path / "absent"}\n'
+                f'VERIFYKEYCONTENT content {fpath}\n'
+                'FUNKY\n'))
+    # one record per process
+    records = [json.loads(l) for l in metrics_file.read_text().splitlines()]
+    eq_(len(records), 2)
+    rec = records[0]
+    eq_(rec['backend'], 'KeyCountingBackend')
+    requests = rec['requests']
+    eq_(set(requests), {'GENKEY', 'VERIFYKEYCONTENT', 'FUNKY'})
+    eq_(requests['GENKEY']['count'], 3)
+    eq_(requests['GENKEY']['failures'], 1)
+    eq_(requests['GENKEY']['bytes'], 14)
+    assert requests['GENKEY']['time'] > 0
+    eq_(requests['VERIFYKEYCONTENT']['count'], 1)
+    eq_(requests['VERIFYKEYCONTENT']['failures'], 0)
+    eq_(requests['VERIFYKEYCONTENT']['bytes'], 7)
+    eq_(requests['FUNKY']['failures'], 1)
+    # no metrics without a target file
+    eq_(Master().metrics, None)
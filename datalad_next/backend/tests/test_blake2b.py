@@ -0,0 +1,144 @@
+import hashlib
+import io
+from pathlib import Path
+from unittest.mock import patch
+
+from datalad.tests.utils_pytest import (
+    assert_raises,
+    eq_,
+    with_tempfile,
+)
+
+from ..base import (
+    BackendError,
+    Master,
+)
+from ..blake2b import (
+    Blake2bBackend,
+    _get_key_size,
+)
+
+
+def _get_key(content):
+    return 'XBLAKE2B256-s{}--{}'.format(
+        len(content),
+        hashlib.blake2b(content, digest_size=32).hexdigest())
+
+
+@with_tempfile(mkdir=True)
+def test_blake2b_genkey(path=None):
+    path = Path(path)
+    output = io.StringIO()
+    master = Master(output=output)
+    backend = Blake2bBackend(master)
+    master.LinkBackend(backend)
+    # force the use of multiple chunks and the worker thread
+    backend.chunk_size = 1000
+    backend.progress_interval = 0
+    for name, content in (
+            ('empty', b''),
+            ('small', b'some'),
+            ('chunk', b'c' * 1000),
+            ('multichunk', bytes(range(256)) * 1000)):
+        fpath = path / name
+        fpath.write_bytes(content)
+        key = backend.gen_key(str(fpath))
+        eq_(key, _get_key(content))
+        assert backend.verify_content(key, str(fpath))
+    # any progress report must be within the file size of the last file
+    for line in output.getvalue().splitlines():
+        assert line.startswith('PROGRESS ')
+        assert int(line[9:]) <= 256000
+
+    # verification failures
+    fpath = path / 'small'
+    # size mismatch
+    assert not backend.verify_content(_get_key(b'other'), str(fpath))
+    # content mismatch
+    assert not backend.verify_content(_get_key(b'soma'), str(fpath))
+    # key without a size
+    assert backend.verify_content(
+        _get_key(b'some').replace('-s4', ''), str(fpath))
+    # error handling
+    assert_raises(BackendError, backend.gen_key, str(path / 'absent'))
+    assert_raises(
+        BackendError, backend.verify_content, _get_key(b'some'),
+        str(path / 'absent'))
+
+
+@with_tempfile
+def test_blake2b_protocol(path=None):
+    Path(path).write_bytes(b'content')
+    output = io.StringIO()
+    master = Master(output=output)
+    master.LinkBackend(Blake2bBackend(master))
+    key = _get_key(b'content')
+    master.Listen(io.StringIO(
+        'CANVERIFY\n'
+        'ISSTABLE\n'
+        'ISCRYPTOGRAPHICALLYSECURE\n'
+        f'GENKEY {path}\n'
+        f'VERIFYKEYCONTENT {key} {path}\n'
+        f'GENKEY {path}-absent\n'))
+    lines = output.getvalue().splitlines()
+    eq_(lines[:5], [
+        'CANVERIFY-YES',
+        'ISSTABLE-YES',
+        'ISCRYPTOGRAPHICALLYSECURE-YES',
+        f'GENKEY-SUCCESS {key}',
+        'VERIFYKEYCONTENT-SUCCESS',
+    ])
+    assert lines[5].startswith('GENKEY-FAILURE ')
+
+
+@with_tempfile(mkdir=True)
+def test_blake2b_parallel(path=None):
+    path = Path(path)
+    requests = []
+    expected = []
+    for i in range(20):
+        content = b'content%i' % i
+        fpath = path / f'file{i}'
+        fpath.write_bytes(content)
+        requests.append(f'GENKEY {fpath}')
+        expected.append(f'GENKEY-SUCCESS {_get_key(content)}')
+        if i == 10:
+            # failures and other requests interleaved
+            requests.extend([f'GENKEY {path}/absent', 'ISSTABLE'])
+            expected.extend([None, 'ISSTABLE-YES'])
+    output = io.StringIO()
+    master = Master(output=output, jobs=2)
+    master.LinkBackend(Blake2bBackend(master))
+    master.Listen(io.StringIO('\n'.join(requests) + '\n'))
+    lines = output.getvalue().splitlines()
+    eq_(len(lines), len(expected))
+    # replies come in the order of the requests
+    for line, exp in zip(lines, expected):
+        if exp is None:
+            assert line.startswith('GENKEY-FAILURE ')
+        else:
+            eq_(line, exp)
+
+
+
+@with_tempfile(mkdir=True)
+def test_blake2b_genkey_no_pool(path=None):
+    fpath = Path(path) / 'file'
+    fpath.write_bytes(b'content')
+    output = io.StringIO()
+    master = Master(output=output, jobs=2)
+    master.LinkBackend(Blake2bBackend(master))
+    # no worker processes, when there is nothing to process in parallel
+    with patch('datalad_next.backend.base.ProcessPoolExecutor') as pool:
+        master.Listen(io.StringIO(f'GENKEY {fpath}\nISSTABLE\n'))
+    pool.assert_not_called()
+    eq_(output.getvalue().splitlines(),
+        [f'GENKEY-SUCCESS {_get_key(b"content")}', 'ISSTABLE-YES'])
+
+
+def test_get_key_size():
+    eq_(_get_key_size('XBLAKE2B256-s10--abc'), 10)
+    eq_(_get_key_size('XBLAKE2B256-m1234-s10--abc'), 10)
+    eq_(_get_key_size('XBLAKE2B256--abc'), None)
+    # hash content is not mistaken for a size field
+    eq_(_get_key_size('XBLAKE2B256--s10'), None)
@@ -1,14 +1,24 @@
 """git-annex external backend XDLRA for git-remote-datalad-annex"""
 
+from concurrent.futures import ThreadPoolExecutor
+import mmap
+import os
 from pathlib import Path
+import struct
 import zipfile
+import zlib
 
 from .base import (
     Backend,
     BackendError,
     Master,
+    get_verification_cache,
 )
 
+# name of the environment variable to enable the verification of the CRC
+# checksums of all members of a repository export archive
+deep_verification_envvar = 'DATALAD_BACKEND_XDLRA_VERIFY_CRC'
+
 
 class DataladRepoAnnexBackend(Backend):
     """Implementation of an external git-annex backend
@@ -31,7 +41,16 @@ class DataladRepoAnnexBackend(Backend):
     to the output of ``git for-each-ref``. ``XDLRA--repo-export`` hold
     a ZIP archive of a bare Git repository.
 
+    With `deep_verification` enabled, the verification of a
+    ``XDLRA--repo-export`` key also checks the CRC checksums of all archive
+    members, such that a corrupted download is detected at the transfer
+    stage already. Members are checked in parallel, reading directly from
+    a memory map of the archive, with bounded memory demands. The
+    environment variable ``DATALAD_BACKEND_XDLRA_VERIFY_CRC`` enables this
+    mode.
     """
+    deep_verification = False
+
     def can_verify(self):
         # we can verify that a key matches the type of content
         # this is basically no more than a sanity check that a
@@ -51,29 +70,244 @@ class DataladRepoAnnexBackend(Backend):
     def gen_key(self, local_file):
         localfile = Path(local_file)
 
-        if _is_component_repoexport(localfile):
-            return "XDLRA--repo-export"
-        elif _is_component_refs(localfile):
-            return "XDLRA--refs"
-        else:
-            # local_file is a TMP location, no use in reporting it
-            raise BackendError('Unrecognized repository clone component')
+        try:
+            # only looks at the head and tail of a file, memory and time
+            # demands do not depend on the file size
+            with localfile.open('rb') as f:
+                if _is_component_repoexport(f):
+                    return "XDLRA--repo-export"
+                elif _is_component_refs(f):
+                    return "XDLRA--refs"
+        except OSError as e:
+            raise BackendError(str(e)) from e
+        # local_file is a TMP location, no use in reporting it
+        raise BackendError('Unrecognized repository clone component')
 
     def verify_content(self, key, content_file):
-        return self.gen_key(content_file) == key
+        if self.gen_key(content_file) != key:
+            return False
+        if self.deep_verification and key == "XDLRA--repo-export":
+            try:
+                _verify_archive_crcs(content_file)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                raise BackendError(f'Corrupted archive: {e}') from e
+        return True
+
+
+# any refs list ends with the HEAD record, on Windows the line ending may
+# be CRLF
+_refs_tail = b' HEAD\n'
+_refs_tail_crlf = b' HEAD\r\n'
+# local file header, or end of central directory record (empty archive)
+_zip_magic = (b'PK\x03\x04', b'PK\x05\x06')
+
+
+def _is_component_refs(f):
+    """Check the tail of a binary file object for the HEAD record"""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size < len(_refs_tail):
+        return False
+    f.seek(-min(size, len(_refs_tail_crlf)), os.SEEK_END)
+    tail = f.read()
+    return tail.endswith(_refs_tail) or tail == _refs_tail_crlf
+
+
+def _is_component_repoexport(f):
+    """Check a binary file object for ZIP magic bytes and a valid trailer"""
+    f.seek(0)
+    if f.read(4) not in _zip_magic:
+        return False
+    # reads the end of central directory record from the tail
+    return zipfile.is_zipfile(f)
+
+
+# size of the fixed part of a local file header, and its layout
+_local_header = struct.Struct('<4s22xHH')
+# amount of data processed at once per archive member
+_crc_chunk_size = 1024 * 1024
+# errors raised by decompressors on corrupted data
+_decompression_errors = (zlib.error, EOFError, OSError)
+try:
+    import bz2
+except ImportError:
+    # Python built without bz2 support
+    bz2 = None
+try:
+    import lzma
+    _decompression_errors += (lzma.LZMAError,)
+except ImportError:
+    # Python built without lzma support
+    lzma = None
+# header of LZMA compressed ZIP members: version, and size of properties
+_lzma_header = struct.Struct('<2xH')
+
+
+def _verify_archive_crcs(path, jobs=None):
+    """Check the CRC checksums of all members of a ZIP archive
 
+    Member data are read from a memory map of the archive, without copying
+    (stored members), or decompressed in chunks of bounded size (deflated,
+    LZMA, and bzip2 members). Members with any other compression method, or
+    one that is not supported by this Python, are only checked structurally.
+    Members are processed in parallel by `jobs` threads. CRC computation and
+    decompression release the interpreter lock.
 
-def _is_component_refs(path):
-    return path.read_text().endswith(' HEAD\n')
+    Raises
+    ------
+    zipfile.BadZipFile
+      If any member is corrupted.
+    """
+    with open(path, 'rb') as f, \
+            zipfile.ZipFile(f) as zf, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, \
+            memoryview(m) as mv:
+        members = [i for i in zf.infolist() if not i.is_dir()]
+        if not members:
+            return
+        with ThreadPoolExecutor(jobs) as pool:
+            futures = [pool.submit(_verify_member_crc, mv, i)
+                       for i in members]
+            try:
+                for fut in futures:
+                    fut.result()
+            finally:
+                # stop processing at the first failure, running workers
+                # finish before the memory map is closed
+                for fut in futures:
+                    fut.cancel()
+
+
+def _verify_member_crc(mv, info):
+    offset = info.header_offset
+    magic, namelen, extralen = _local_header.unpack_from(mv, offset)
+    if magic != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f'Bad local header for {info.filename!r}')
+    start = offset + _local_header.size + namelen + extralen
+    end = start + info.compress_size
+    if end > len(mv):
+        raise zipfile.BadZipFile(f'Truncated member {info.filename!r}')
+    method = info.compress_type
+    if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) \
+            and not (method == zipfile.ZIP_LZMA and lzma) \
+            and not (method == zipfile.ZIP_BZIP2 and bz2):
+        # unknown compression method, or no support for it in this
+        # Python, the structural check has to do
+        return
+    # all views on the memory map are released explicitly, a view kept
+    # alive (e.g. by a traceback) would prevent closing the map
+    with mv[start:end] as data:
+        try:
+            if method == zipfile.ZIP_STORED:
+                crc = _crc(data)
+                size = len(data)
+            elif method == zipfile.ZIP_DEFLATED:
+                crc, size = _inflate_crc(data)
+            elif method == zipfile.ZIP_BZIP2:
+                crc, size = _decompress_crc(data, bz2.BZ2Decompressor())
+            else:
+                crc, size = _unlzma_crc(data, info)
+        except _decompression_errors as e:
+            error = f'Cannot decompress {info.filename!r}: {e}'
+        else:
+            error = None
+    if error:
+        raise zipfile.BadZipFile(error)
+    if size != info.file_size or crc != info.CRC:
+        raise zipfile.BadZipFile(f'Bad CRC-32 for {info.filename!r}')
+
+
+def _crc(data):
+    crc = 0
+    for pos in range(0, len(data), _crc_chunk_size):
+        with data[pos:pos + _crc_chunk_size] as chunk:
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _inflate_crc(data):
+    """Returns CRC and size of the decompressed content of a deflate stream
+
+    Never holds more than a chunk of decompressed data in memory.
+    """
+    d = zlib.decompressobj(-zlib.MAX_WBITS)
+    crc = 0
+    size = 0
+    for pos in range(0, len(data), _crc_chunk_size):
+        with data[pos:pos + _crc_chunk_size] as chunk:
+            out = d.decompress(chunk, _crc_chunk_size)
+        while True:
+            crc = zlib.crc32(out, crc)
+            size += len(out)
+            if not d.unconsumed_tail:
+                break
+            out = d.decompress(d.unconsumed_tail, _crc_chunk_size)
+    while not d.eof:
+        out = d.flush(_crc_chunk_size)
+        if not out:
+            break
+        crc = zlib.crc32(out, crc)
+        size += len(out)
+    if not d.eof:
+        raise zlib.error('incomplete deflate stream')
+    return crc, size
+
+
+def _unlzma_crc(data, info):
+    """Returns CRC and size of the content of an LZMA compressed member
+
+    Such a member starts with a header with the properties of the LZMA1
+    stream that follows.
+    """
+    if len(data) < _lzma_header.size:
+        raise EOFError('incomplete LZMA header')
+    propsize, = _lzma_header.unpack_from(data)
+    start = _lzma_header.size + propsize
+    if propsize != 5 or len(data) < start:
+        raise EOFError('invalid LZMA properties')
+    with data[_lzma_header.size:start] as props:
+        # see the LZMA SDK: properties byte, and dictionary size
+        lc = props[0] % 9
+        lp = (props[0] // 9) % 5
+        pb = props[0] // 45
+        dict_size = int.from_bytes(props[1:5], 'little')
+    d = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[dict(
+        id=lzma.FILTER_LZMA1, dict_size=dict_size, lc=lc, lp=lp, pb=pb)])
+    with data[start:] as stream:
+        # the end of the stream need only be marked, if flagged as such
+        # (general purpose bit 1), otherwise a truncated stream is detected
+        # by the size and CRC check
+        return _decompress_crc(
+            stream, d, require_eof=bool(info.flag_bits & 0x2))
 
 
-def _is_component_repoexport(path):
-    return zipfile.is_zipfile(path)
+def _decompress_crc(data, d, require_eof=True):
+    """Returns CRC and size of the content decompressed by a decompressor
+
+    The decompressor must have the interface of `bz2.BZ2Decompressor` and
+    `lzma.LZMADecompressor`. Never holds more than a chunk of decompressed
+    data in memory.
+    """
+    crc = 0
+    size = 0
+    for pos in range(0, len(data), _crc_chunk_size):
+        with data[pos:pos + _crc_chunk_size] as chunk:
+            out = d.decompress(chunk, _crc_chunk_size)
+        while True:
+            crc = zlib.crc32(out, crc)
+            size += len(out)
+            if d.eof or d.needs_input:
+                break
+            out = d.decompress(b'', _crc_chunk_size)
+    if require_eof and not d.eof:
+        raise EOFError('incomplete compressed stream')
+    return crc, size
 
 
 def main():
     """Entry point for the backend utility"""
     master = Master()
     backend = DataladRepoAnnexBackend(master)
-    master.LinkBackend(backend)
+    backend.deep_verification = bool(os.environ.get(deep_verification_envvar))
+    master.LinkBackend(backend, get_verification_cache())
     master.Listen()
@@ -1 +1,41 @@
+from unittest.mock import patch
+
+import pytest
+
 from datalad.conftest import setup_package
+from datalad.config import ConfigManager
+
+
+@pytest.fixture
+def counting_keyring():
+    """Patch in an in-memory keyring that counts `get()` calls
+
+    The process-wide keyring cache of the credential manager is cleared
+    before the keyring is handed out.
+    """
+    from datalad_next.credman import _keyring_cache
+    from datalad_next.tests.utils import CountingKeyring
+    keyring = CountingKeyring()
+    with patch('datalad.support.keyring_.keyring', keyring):
+        _keyring_cache.clear()
+        yield keyring
+    _keyring_cache.clear()
+
+
+@pytest.fixture
+def git_config_writes():
+    """Record the arguments of all `git config` calls that are no reads
+
+    A list is handed out, which is extended by the arguments of any
+    such call of `ConfigManager._run()`.
+    """
+    writes = []
+    orig_run = ConfigManager._run
+
+    def counting_run(self, args, **kwargs):
+        if '-l' not in args:
+            writes.append(args)
+        return orig_run(self, args, **kwargs)
+
+    with patch.object(ConfigManager, '_run', counting_run):
+        yield writes
@@ -453,9 +453,9 @@ def _get_url_credential(name, url, credman):
         credprops = get_specialremote_credential_properties(
             dict(type='webdav', url=url))
         if credprops:
-            creds = credman.query(_sortby='last-used', **credprops)
-            if creds:
-                name, cred = creds[0]
+            match = credman.query_first(_sortby='last-used', **credprops)
+            if match:
+                name, cred = match
 
     if not cred:
         kwargs = dict(
@@ -0,0 +1,368 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See LICENSE file distributed along with the datalad_osf package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Credential cache daemon
+
+Many processes that run in parallel (e.g., ``git annex copy -J16`` to a WebDAV
+special remote, or concurrent ``git-remote-datalad-annex`` helpers) each create
+their own ``CredentialManager``, and query the keyring independently. With
+a slow keyring backend (e.g., an encrypted file on a headless system) this can
+be costly.
+
+In the spirit of ``git credential-cache``, this module implements a daemon
+that keeps credential fields retrieved from the keyring in memory for a
+limited time, and a client to talk to it. The daemon listens on a Unix socket
+in a directory that is only accessible by the user. The client checks this,
+and that the socket is owned by the user, before each request. The daemon is
+started on demand by the client, and exits once its cache is empty and it was
+idle for the cache timeout.
+
+Communication uses one JSON-encoded request and reply per connection, and
+is never essential: any failure to talk to the daemon merely leads to a
+regular keyring lookup.
+
+The daemon is used by ``CredentialManager``, if the configuration
+``datalad.credentials.cache-daemon`` is enabled.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import threading
+import time
+
+from datalad.support.exceptions import CapturedException
+
+lgr = logging.getLogger('datalad.credcache')
+
+
+class CredentialCacheClient(object):
+    """Client of a credential cache daemon
+
+    All methods fail silently (with a debug message) when the daemon cannot
+    be reached.
+    """
+    # seconds to wait for the daemon to respond, and to start up
+    connect_timeout = 2.0
+
+    def __init__(self, socket_path, timeout, autostart=True):
+        """
+        Parameters
+        ----------
+        socket_path: Path
+          Unix socket of the daemon. Its parent directory is created with
+          user-only permissions, if it does not exist.
+        timeout: float
+          Time (in seconds) for which the daemon keeps a credential field.
+        autostart: bool, optional
+          Whether to start a daemon, if none is running.
+        """
+        self.socket_path = Path(socket_path)
+        self.timeout = timeout
+        self.autostart = autostart
+        # the daemon is not started more than once per client
+        self._start_attempted = False
+
+    def get(self, name, field):
+        """Returns a tuple of a flag whether the field is known, and its value
+        """
+        reply = self._request(action='get', name=name, field=field)
+        if reply is None or not reply.get('found'):
+            return False, None
+        return True, reply.get('value')
+
+    def store(self, name, field, value):
+        self._request(
+            action='store', name=name, field=field, value=value,
+            timeout=self.timeout)
+
+    def erase(self, name):
+        """Remove all fields of a credential from the cache"""
+        # no need to start a daemon to erase from an empty cache
+        self._request(action='erase', name=name, _start=False)
+
+    def exit(self):
+        """Stop the daemon"""
+        self._request(action='exit', _start=False)
+
+    def _request(self, _start=True, **request):
+        try:
+            return self._send(request)
+        except PermissionError as e:
+            # never talk to, or start, a daemon that is not safe to use
+            CapturedException(e)
+            lgr.debug('Not using credential cache daemon: %s', e)
+            return None
+        except OSError as e:
+            # no daemon (yet)
+            error = e
+        except Exception as e:
+            CapturedException(e)
+            lgr.debug('Cannot use credential cache daemon: %s', e)
+            return None
+        if not _start or not self.autostart or self._start_attempted:
+            CapturedException(error)
+            lgr.debug('Credential cache daemon not available: %s', error)
+            return None
+        try:
+            self._start_daemon()
+            return self._send(request)
+        except Exception as e:
+            CapturedException(e)
+            lgr.debug('Cannot use credential cache daemon: %s', e)
+            return None
+
+    def _send(self, request):
+        # credentials must only go to a daemon of the user, in a place that
+        # nobody else can tamper with
+        _check_private_dir(self.socket_path.parent)
+        _check_socket_owner(self.socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(self.connect_timeout)
+            s.connect(str(self.socket_path))
+            s.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            s.shutdown(socket.SHUT_WR)
+            with s.makefile('rb') as f:
+                reply = f.readline()
+        return json.loads(reply) if reply else None
+
+    def _start_daemon(self):
+        self._start_attempted = True
+        _ensure_private_dir(self.socket_path.parent)
+        lgr.debug('Starting credential cache daemon at %s', self.socket_path)
+        subprocess.Popen(
+            [sys.executable, '-m', __name__,
+             str(self.socket_path), str(self.timeout)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # must not be affected by signals to the process group
+            # of the client
+            start_new_session=True,
+            close_fds=True,
+        )
+        deadline = time.monotonic() + self.connect_timeout
+        while not self.socket_path.exists():
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f'Credential cache daemon did not start at '
+                    f'{self.socket_path}')
+            time.sleep(0.01)
+
+
+class CredentialCache(object):
+    """In-memory cache of credential fields with a per-entry expiration"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, name, field):
+        with self._lock:
+            self._expire()
+            entry = self._entries.get((name, field))
+        return (False, None) if entry is None else (True, entry[1])
+
+    def store(self, name, field, value, timeout):
+        with self._lock:
+            self._entries[(name, field)] = (time.monotonic() + timeout, value)
+
+    def erase(self, name):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == name]:
+                del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [k for k, v in self._entries.items() if v[0] <= now]:
+            del self._entries[key]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # seconds to wait for a client, a stalled client must not block the
+    # daemon
+    timeout = CredentialCacheClient.connect_timeout
+
+    def handle(self):
+        server = self.server
+        server.last_activity = time.monotonic()
+        try:
+            request = json.loads(self.rfile.readline())
+            reply = server.process(request)
+        except Exception as e:
+            # a broken client must not take the daemon down
+            reply = dict(error=str(e))
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class CredentialCacheServer(socketserver.UnixStreamServer):
+    """Credential cache daemon
+
+    Requests are processed one at a time. They are small, and processing them
+    is fast.
+    """
+    def __init__(self, socket_path, timeout):
+        self.socket_path = Path(socket_path)
+        self.timeout_idle = timeout
+        self.cache = CredentialCache()
+        self.last_activity = time.monotonic()
+        self.exit_requested = False
+        # socket is only accessible by the user
+        umask = os.umask(0o077)
+        try:
+            super().__init__(str(self.socket_path), _RequestHandler)
+        finally:
+            os.umask(umask)
+        # check for expiration of the daemon itself in regular intervals
+        self.timeout = 1.0
+
+    def process(self, request):
+        action = request.get('action')
+        if action == 'get':
+            found, value = self.cache.get(request['name'], request['field'])
+            return dict(found=found, value=value)
+        elif action == 'store':
+            self.cache.store(
+                request['name'], request['field'], request['value'],
+                min(float(request.get('timeout', self.timeout_idle)),
+                    self.timeout_idle))
+        elif action == 'erase':
+            self.cache.erase(request['name'])
+        elif action == 'exit':
+            self.exit_requested = True
+        else:
+            raise ValueError(f'Unknown action {action!r}')
+        return dict()
+
+    def serve(self):
+        """Process requests until exit is requested, or the daemon expired"""
+        try:
+            while not self.exit_requested:
+                self.handle_request()
+                if not len(self.cache) and \
+                        time.monotonic() - self.last_activity \
+                        > self.timeout_idle:
+                    break
+        finally:
+            self.server_close()
+            # only remove the socket, if it is still ours
+            try:
+                if self.socket_path.stat().st_ino == self._socket_ino:
+                    self.socket_path.unlink()
+            except OSError:
+                pass
+
+    def server_bind(self):
+        super().server_bind()
+        self._socket_ino = self.socket_path.stat().st_ino
+
+
+def _ensure_private_dir(path):
+    """Create a directory that is only accessible by the user
+
+    Raises
+    ------
+    PermissionError
+      If an existing directory is owned by another user, or accessible to
+      others.
+    """
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    _check_private_dir(path)
+
+
+def _check_uid_support():
+    """Check that file ownership can be compared to the user
+
+    Raises
+    ------
+    PermissionError
+      If there is no ``os.getuid()`` on this platform (e.g. Windows).
+    """
+    if not hasattr(os, 'getuid'):
+        raise PermissionError(
+            'Credential cache daemon unavailable, file ownership cannot be '
+            'verified on this platform')
+
+
+def _check_private_dir(path):
+    """Check that an existing directory is only accessible by the user
+
+    Raises
+    ------
+    PermissionError
+      If the directory is owned by another user, or accessible to others,
+      or if ownership cannot be determined on this platform.
+    FileNotFoundError
+      If the directory does not exist.
+    """
+    _check_uid_support()
+    st = path.stat()
+    if st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+        raise PermissionError(
+            f'Permissions on credential cache directory {path} are too loose, '
+            'must only be accessible by the user')
+
+
+def _check_socket_owner(path):
+    """Check that a socket exists and is owned by the user
+
+    Raises
+    ------
+    PermissionError
+      If the path is not a socket, or is owned by another user, or if
+      ownership cannot be determined on this platform.
+    FileNotFoundError
+      If the socket does not exist.
+    """
+    _check_uid_support()
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(
+            f'Credential cache socket {path} is not a socket owned by the '
+            'user')
+
+
+def run_daemon(socket_path, timeout):
+    """Serve a credential cache at a socket, until expired
+
+    Nothing is done, if another daemon is already serving at the socket.
+    """
+    socket_path = Path(socket_path)
+    _ensure_private_dir(socket_path.parent)
+    if socket_path.exists():
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(str(socket_path))
+            # somebody else is serving already
+            return
+        except OSError:
+            # stale socket of a crashed daemon
+            socket_path.unlink()
+    try:
+        server = CredentialCacheServer(socket_path, timeout)
+    except OSError as e:
+        # lost a race against another daemon
+        CapturedException(e)
+        return
+    server.serve()
+
+
+if __name__ == '__main__':
+    run_daemon(sys.argv[1], float(sys.argv[2]))
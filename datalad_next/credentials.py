@@ -10,8 +10,11 @@
 
 __docformat__ = 'restructuredtext'
 
+from contextlib import nullcontext
 import json
 import logging
+import os
+import sys
 
 from datalad import (
     cfg as dlcfg,
@@ -46,7 +49,7 @@ from datalad.support.constraints import (
 
 lgr = logging.getLogger('datalad.local.credentials')
 
-credential_actions = ('query', 'get', 'set', 'remove')
+credential_actions = ('query', 'get', 'set', 'remove', 'import', 'export')
 
 
 @build_doc
@@ -56,7 +59,7 @@ class Credentials(Interface):
     This command enables inspection and manipulation of credentials used
     throughout DataLad.
 
-    The command provides four basic actions:
+    The command provides four basic actions, and two bulk actions:
 
 
     QUERY
@@ -96,6 +99,30 @@ class Credentials(Interface):
     credential identified by its name.
 
 
+    IMPORT
+
+    Set any number of credentials from a file (or stdin) with one credential
+    record per line, in JSON format (JSON lines). Each record is an object
+    with the credential ``name``, its ``secret``, and any other properties,
+    e.g.::
+
+      {"name": "mycred", "secret": "s3cr3t", "realm": "https://example.com"}
+
+    Properties with a ``null`` value are removed. In contrast to 'set', no
+    interactive secret entry is performed, and all property changes are
+    written to the configuration at once. This makes it suitable for
+    provisioning a large number of credentials.
+
+
+    EXPORT
+
+    Write credentials, including their secrets, to a file in the format
+    that is supported by 'import'. Without a credential name, all
+    discoverable credentials are exported, optionally constrained by
+    property/value pairs like for a query. The file is only readable and
+    writable by the user.
+
+
     GET (plumbing operation)
 
     This is a *read-only* action that will never store (updates of) credential
@@ -194,6 +221,13 @@ class Credentials(Interface):
             supported, e.g., spec=['type=user_password'] PY]""",
             nargs='*',
             metavar='[name] [:]property[=value]'),
+        file=Parameter(
+            args=("--file",),
+            doc="""path of a file with one JSON-formatted credential record
+            per line, to read credentials from (action 'import'), or to write
+            credentials to (action 'export'). If not given for action
+            'import', records are read from stdin.""",
+            constraints=EnsureStr() | EnsureNone()),
         prompt=Parameter(
             args=("--prompt",),
             doc="""message to display when entry of missing credential
@@ -220,6 +254,15 @@ class Credentials(Interface):
         dict(text="Upgrade a legacy credential by annotating it with a 'type' property",
              code_py="credentials('set', name='legacycred', spec={'type': 'user_password')",
              code_cmd="datalad credentials set legacycred type=user_password"),
+        dict(text="Set many credentials from a file with one JSON record "
+                  "per line",
+             code_py="credentials('import', file='credentials.jsonl')",
+             code_cmd="datalad credentials import --file credentials.jsonl"),
+        dict(text="Export all credentials for a realm to a file",
+             code_py="credentials('export', file='credentials.jsonl', "
+                     "spec={'realm': 'https://example.com'})",
+             code_cmd="datalad credentials export --file credentials.jsonl "
+                      "realm=https://example.com"),
         dict(text="Obtain a (possibly yet undefined) credential with a minimum set of "
                   "properties. All missing properties and secret will be "
                   "prompted for, no information will be stored! "
@@ -233,11 +276,12 @@ class Credentials(Interface):
     @datasetmethod(name='credentials')
     @eval_results
     def __call__(action='query', spec=None, *, name=None, prompt=None,
-                 dataset=None):
+                 dataset=None, file=None):
         if action not in credential_actions:
             raise ValueError(f"Unknown action {action!r}")
 
-        if action in ('get', 'set', 'remove') and not name and spec \
+        if action in ('get', 'set', 'remove', 'export') and not name \
+                and spec \
                 and isinstance(spec, list):
             # spec came in like from the CLI (but doesn't have to be from
             # there) and we have no name set
@@ -251,6 +295,12 @@ class Credentials(Interface):
         if action in ('set', 'remove') and not name:
             raise ValueError(
                 f"Credential name must be provided for action {action!r}")
+        if action == 'import' and (name or specs):
+            raise ValueError(
+                "No credential name or properties can be given for action "
+                "'import', specify them in the records to import")
+        if action == 'export' and not file:
+            raise ValueError("A file must be given for action 'export'")
         if action == 'get' and not name and not spec:
             raise ValueError(
                 "Cannot get credential properties when no name and no "
@@ -325,6 +375,10 @@ class Credentials(Interface):
                     type='credential',
                     **_prefix_result_keys(cred),
                 )
+        elif action == 'import':
+            yield from _import_credentials(credman, file)
+        elif action == 'export':
+            yield from _export_credentials(credman, file, name, specs)
         else:
             raise RuntimeError('Impossible state reached')  # pragma: no cover
 
@@ -432,3 +486,82 @@ def _prefix_result_keys(props):
         f'cred_{k}' if not k.startswith('_') else k[1:]: v
         for k, v in props.items()
     }
+
+
+def _import_credentials(credman, file):
+    """Set credentials from JSON lines read from a file or stdin"""
+    creds = {}
+    with (open(file, encoding='utf-8') if file else nullcontext(sys.stdin)) \
+            as f:
+        for i, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                if not isinstance(rec, dict):
+                    raise ValueError('record is not a JSON object')
+                name = rec.pop('name', None)
+                if not isinstance(name, str) or not name:
+                    raise ValueError('no credential name')
+                if not all(v is None or isinstance(v, str)
+                           for v in rec.values()):
+                    raise ValueError('property values must be strings')
+                props = normalize_specs(rec)
+                if props.get('secret') is None:
+                    raise ValueError('no secret')
+            except ValueError as e:
+                yield get_status_dict(
+                    action='credentials',
+                    status='error',
+                    message=('invalid credential record in line %i', i),
+                    exception=CapturedException(e),
+                )
+                continue
+            # a later record for the same credential supersedes
+            creds[name] = props
+    if not creds:
+        return
+    try:
+        updated = credman.set_many(creds)
+    except Exception as e:
+        yield get_status_dict(
+            action='credentials',
+            status='error',
+            message='could not import credentials',
+            exception=CapturedException(e),
+        )
+        return
+    for name, props in updated.items():
+        yield get_status_dict(
+            action='credentials',
+            status='ok',
+            name=name,
+            **_prefix_result_keys(props),
+        )
+
+
+def _export_credentials(credman, file, name, specs):
+    """Write (matching) credentials as JSON lines to a file"""
+    if name:
+        cred = credman.get(name, **specs)
+        creds = [(name, cred)] if cred else []
+    else:
+        creds = credman.query_(**specs)
+    # secrets are written, only the user must have access
+    fd = os.open(file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    if hasattr(os, 'fchmod'):
+        # also for a file that existed already
+        os.fchmod(fd, 0o600)
+    with open(fd, 'w', encoding='utf-8') as f:
+        for cname, cred in creds:
+            rec = dict(name=cname)
+            rec.update(
+                (k, v) for k, v in cred.items() if not k.startswith('_'))
+            f.write(json.dumps(rec) + '\n')
+            yield get_status_dict(
+                action='credentials',
+                status='ok',
+                name=cname,
+                type='credential',
+                message=('exported to %s', file),
+            )
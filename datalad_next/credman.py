@@ -12,9 +12,15 @@ __docformat__ = 'restructuredtext'
 
 __all__ = ['CredentialManager']
 
+from collections.abc import Mapping
 from datetime import datetime
 import logging
+import os
+from pathlib import Path
 import re
+import socket
+import threading
+import time
 
 import datalad
 from datalad.support.exceptions import (
@@ -74,8 +80,9 @@ class CredentialManager(object):
           ``ConfigManager`` instance. Otherwise ``datalad.cfg`` is used.
         """
         self.__cfg = cfg
-        self.__cred_types = None
         self.__keyring = None
+        self.__cache_ttl = None
+        self.__cache_daemon = None
 
     # main API
     #
@@ -150,13 +157,8 @@ class CredentialManager(object):
             cred = self._get_legacy_field_from_keyring(
                 name, kwargs.get('type', _type_hint)) or {}
 
-            var_prefix = _get_cred_cfg_var(name, '')
             # get related info from config
-            cred.update({
-                k[len(var_prefix):]: v
-                for k, v in self._cfg.items()
-                if k.startswith(var_prefix)
-            })
+            cred.update(self._get_credential_props_from_cfg().get(name, {}))
 
         # final word on the credential type
         _type_hint = cred.get('type', kwargs.get('type', _type_hint))
@@ -282,36 +284,16 @@ class CredentialManager(object):
         if _lastused:
             cred['last-used'] = datetime.now().isoformat()
 
-        # remove props
-        #
-        remove_props = [
-            k for k, v in cred.items() if v is None and k != 'secret']
-        self._unset_credprops_anyscope(name, remove_props)
-        updated = {k: None for k in remove_props}
-
-        # set non-secret props
-        #
-        set_props = {
-            k: v for k, v in cred.items()
-            if v is not None and k != 'secret'
-        }
-        for k, v in set_props.items():
-            var = _get_cred_cfg_var(name, k)
-            if self._cfg.get(var) == v:
-                # desired value already exists, we are not
-                # storing again to preserve the scope it
-                # was defined in
-                continue
-            # we always write to the global scope (ie. user config)
-            # credentials are typically a personal, not a repository
-            # specific entity -- likewise secrets go into a personal
-            # not repository-specific store
-            # for custom needs users can directly set the respective
-            # config
-            self._cfg.set(var, v, scope='global', force=True, reload=False)
-            updated[k] = v
-        if set_props:
-            self._cfg.reload()
+        updated = self._get_credprops_updates(name, cred)
+        # we always write to the global scope (ie. user config)
+        # credentials are typically a personal, not a repository
+        # specific entity -- likewise secrets go into a personal
+        # not repository-specific store
+        # for custom needs users can directly set the respective
+        # config
+        # all changes are applied at once, and the config is reloaded
+        # only once
+        self._update_credprops_anyscope({name: updated})
 
         # set secret
         #
@@ -338,11 +320,74 @@ class CredentialManager(object):
         # or provided, or entered. we always want to put it in the
         # store
         self._keyring.set(name, 'secret', cred['secret'])
+        _keyring_cache.invalidate(name, self._cache_daemon)
         if cred['secret'] != prev_secret:
             # only report updated if actually different from before
             updated['secret'] = cred['secret']
         return updated
 
+    def set_many(self, creds, _lastused=False):
+        """Set properties and secrets of any number of credentials
+
+        This is the bulk variant of ``set()``, intended for provisioning
+        many credentials at once. All property changes are applied with a
+        single config reload, followed by all secret writes.
+
+        In contrast to ``set()``, each credential record must include a
+        secret (no interactive entry is attempted), and no properties
+        of legacy credentials are migrated.
+
+        Parameters
+        ----------
+        creds: dict
+          Mapping of credential names to dicts with property name/value
+          pairs, including the ``secret``. Values of ``None`` indicate
+          removal of a property. Properties whose name starts with an
+          underscore are ignored.
+        _lastused: bool, optional
+          If set, automatically add an additional credential property
+          ``'last-used'`` with the current timestamp in ISO 8601 format.
+
+        Returns
+        -------
+        dict
+          Mapping of credential names to dicts with the key/values of all
+          modified credential properties with respect to their previously
+          recorded values. The secret is always written, and always
+          reported.
+
+        Raises
+        ------
+        ValueError
+          When property names are not syntax-compliant, or a credential
+          record has no secret. Nothing is stored in this case.
+        RuntimeError
+          This exception is raised whenever a property cannot be removed
+          successfully. Likely cause is that it is defined in a configuration
+          scope or backend for which write-access is not supported.
+        """
+        records = {}
+        for name, cred in creds.items():
+            cred = {k: v for k, v in cred.items() if not k.startswith('_')}
+            verify_property_names(cred)
+            if cred.get('secret') is None:
+                raise ValueError(f'No secret for credential {name!r}')
+            if _lastused:
+                cred['last-used'] = datetime.now().isoformat()
+            records[name] = cred
+        # one pass over all credentials to determine the necessary changes,
+        # and a single config write to apply them
+        updated = {
+            name: self._get_credprops_updates(name, cred)
+            for name, cred in records.items()
+        }
+        self._update_credprops_anyscope(updated)
+        for name, cred in records.items():
+            self._keyring.set(name, 'secret', cred['secret'])
+            _keyring_cache.invalidate(name, self._cache_daemon)
+            updated[name]['secret'] = cred['secret']
+        return updated
+
     def remove(self, name, type_hint=None):
         """Remove a credential, including all properties and secret
 
@@ -365,17 +410,7 @@ class CredentialManager(object):
           successfully. Likely cause is that it is defined in a configuration
           scope or backend for which write-access is not supported.
         """
-        # prefix for all config variables of this credential
-        prefix = _get_cred_cfg_var(name, '')
-
-        def _get_props():
-            return (k[len(prefix):] for k in self._cfg.keys()
-                    if k.startswith(prefix))
-
-        to_remove = [
-            k[len(prefix):] for k in self._cfg.keys()
-            if k.startswith(prefix)
-        ]
+        to_remove = list(self._get_credential_props_from_cfg().get(name, {}))
         removed = False
         if to_remove:
             self._unset_credprops_anyscope(name, to_remove)
@@ -395,15 +430,18 @@ class CredentialManager(object):
                     # we could not delete the field
                     raise
 
-        del_field(name, 'secret')
-        if type_hint:
-            # remove legacy records too
-            for field in self._cred_types.get(
-                    type_hint, {}).get('fields', []):
-                del_field(name, field)
+        try:
+            del_field(name, 'secret')
+            if type_hint:
+                # remove legacy records too
+                for field in self._cred_types.get(
+                        type_hint, {}).get('fields', []):
+                    del_field(name, field)
+        finally:
+            _keyring_cache.invalidate(name, self._cache_daemon)
         return removed
 
-    def query_(self, **kwargs):
+    def query_(self, _lazy_secret=False, **kwargs):
         """Query for all (matching) credentials.
 
         Credentials are yielded in no particular order.
@@ -414,8 +452,18 @@ class CredentialManager(object):
         This method does support lookup of credentials defined in DataLad's
         "provider" configurations.
 
+        Matching is performed on the non-secret properties of a credential
+        (unless a ``secret`` is given as a query property), and a secret is
+        only retrieved for a matching credential.
+
         Parameters
         ----------
+        _lazy_secret: bool, optional
+          If set, the secret of a credential defined in the configuration is
+          only retrieved (e.g., from the keyring) when it is accessed in a
+          credential record. Consequently, such a record can have a
+          ``secret`` of ``None``, if no secret is found for a credential.
+          By default, credentials without a secret are not yielded.
         **kwargs
           If not given, any found credential is yielded. Otherwise,
           any credential must match all property name/value
@@ -429,19 +477,32 @@ class CredentialManager(object):
           matching credential.
         """
         done = set()
-        known_credentials = set(
-            ('.'.join(k.split('.')[2:-1]), None) for k in self._cfg.keys()
-            if k.startswith('datalad.credential.')
-        )
+        # a single pass over the config, to get the properties of all
+        # credentials grouped by name
+        cfg_credentials = self._get_credential_props_from_cfg()
         from itertools import chain
         for name, type_hint in chain(
                 _yield_legacy_credential_names(),
-                known_credentials):
+                ((n, None) for n in cfg_credentials)):
             if name in done:
                 continue
             done.add(name)
-            cred = self.get(name, _prompt=None, _type_hint=type_hint)
-            if not cred:
+            if kwargs and not self._may_match(
+                    cfg_credentials.get(name, {}), type_hint, kwargs):
+                # reject early based on the non-secret properties on record,
+                # without any keyring access
+                continue
+            if type_hint is None:
+                # all properties are known, only the secret needs a
+                # (deferred) lookup
+                cred = self._get_lazy_credential(
+                    name, cfg_credentials[name])
+                if not _lazy_secret and cred['secret'] is None:
+                    continue
+            else:
+                # legacy credential properties come from the keyring
+                cred = self.get(name, _prompt=None, _type_hint=type_hint)
+            if cred is None:
                 continue
             if not kwargs:
                 yield (name, cred)
@@ -451,7 +512,8 @@ class CredentialManager(object):
                 else:
                     continue
 
-    def query(self, _sortby=None, _reverse=True, **kwargs):
+    def query(self, _sortby=None, _reverse=True, _lazy_secret=False,
+              **kwargs):
         """Query for all (matching) credentials, sorted by a property
 
         This method is a companion of ``query_()``, and the same limitations
@@ -472,6 +534,8 @@ class CredentialManager(object):
           By default credentials are return in descending property
           value order. This flag does not impact the fact that credentials
           without the property to sort by always sort last.
+        _lazy_secret: bool, optional
+          Pass on as-is to ``query_()``
         **kwargs
           Pass on as-is to ``query_()``
 
@@ -482,7 +546,7 @@ class CredentialManager(object):
           credential name, the second element is the credential record
           as returned by ``get()`` for any matching credential.
         """
-        matches = self.query_(**kwargs)
+        matches = self.query_(_lazy_secret=_lazy_secret, **kwargs)
         if _sortby is None:
             return list(matches)
 
@@ -498,6 +562,28 @@ class CredentialManager(object):
 
         return sorted(matches, key=get_sort_key, reverse=_reverse)
 
+    def query_first(self, _sortby=None, _reverse=True, **kwargs):
+        """Returns the first credential of a sorted query that has a secret
+
+        This method is a companion of ``query()``, and accepts the same
+        arguments. Credentials are filtered and sorted by their non-secret
+        properties, and secrets are only retrieved until a credential with
+        a secret is found. This is the typical lookup of the most recently
+        used credential for a realm (``_sortby='last-used'``).
+
+        Returns
+        -------
+        tuple(str, dict) or None
+          The credential name and credential record, or ``None`` if no
+          matching credential with a secret was found.
+        """
+        return next(
+            (c for c in self.query(
+                _sortby=_sortby, _reverse=_reverse, _lazy_secret=True,
+                **kwargs)
+             if c[1]['secret']),
+            None)
+
 
     # internal helpers
     #
@@ -527,37 +613,204 @@ class CredentialManager(object):
                 'datalad.credentials.hidden-secret-entry'),
         )
 
+    def _get_lazy_credential(self, name, props):
+        """Returns a credential record with a secret retrieved on access
+
+        This is equivalent to ``get(name)`` for a credential without a type
+        hint, whose properties are all defined in the config.
+        """
+        if 'secret' in props:
+            # config always takes precedence
+            return dict(props)
+        return _LazySecretCredential(
+            props,
+            lambda: self._get_secret(name, type_hint=props.get('type')),
+        )
+
+    def _get_credential_props_from_cfg(self):
+        """Returns the properties of all credentials defined in the config
+
+        The mapping is reused for as long as no credential property in the
+        config changes. It must not be modified.
+
+        Returns
+        -------
+        dict
+          Mapping of credential names to dicts with all property name/value
+          pairs of a credential.
+        """
+        return _credential_props_cache.get(self._cfg.items())
+
+    def _may_match(self, props, type_hint, kwargs):
+        """Returns whether a credential may match all query properties
+
+        Parameters
+        ----------
+        props: dict
+          Properties of the credential defined in the config.
+        type_hint: str or None
+          Legacy credential type. If known, additional properties may be
+          obtained from the keyring.
+        kwargs: dict
+          Query property name/value pairs.
+
+        Returns
+        -------
+        bool
+          False, if a mismatch can be determined from the config alone.
+        """
+        legacy_props = None
+        for k, v in kwargs.items():
+            if k == 'secret':
+                # only known after a keyring query
+                continue
+            if k in props:
+                # config always takes precedence
+                if props[k] != v:
+                    return False
+                continue
+            if v is None:
+                continue
+            if legacy_props is None:
+                legacy_props = self._get_legacy_props(type_hint)
+            if k not in legacy_props:
+                # no other source for this property
+                return False
+        return True
+
+    def _get_legacy_props(self, type_hint):
+        """Returns names of properties a legacy credential type can have"""
+        lc = self._cred_types.get(type_hint) if type_hint else None
+        if not lc:
+            return set()
+        # see _get_legacy_field_from_keyring()
+        return set(
+            f.replace('_', '-') for f in (lc['fields'] or [])
+            if f != lc['secret']
+        ).union(('type',))
+
     def _props_defined_in_cfg(self, name, keys):
         return [
             k for k in keys
             if _get_cred_cfg_var(name, k) in self._cfg
         ]
 
+    def _get_credprops_updates(self, name, cred):
+        """Returns the property changes needed to store a credential record
+
+        Parameters
+        ----------
+        name: str
+          Credential name
+        cred: dict
+          Credential record. A value of ``None`` indicates the removal of a
+          property. The secret is ignored.
+
+        Returns
+        -------
+        dict
+          Property name/value pairs of all properties to remove (``None``)
+          or to set.
+        """
+        # remove props
+        #
+        updated = {
+            k: None for k, v in cred.items() if v is None and k != 'secret'}
+
+        # set non-secret props
+        #
+        for k, v in cred.items():
+            if v is None or k == 'secret':
+                continue
+            var = _get_cred_cfg_var(name, k)
+            if self._cfg.get(var) == v:
+                # desired value already exists, we are not
+                # storing again to preserve the scope it
+                # was defined in
+                continue
+            updated[k] = v
+        return updated
+
     def _unset_credprops_anyscope(self, name, keys):
         """Reloads the config after unsetting all relevant variables
 
         This method does not modify the keystore.
         """
+        self._update_credprops_anyscope({name: {k: None for k in keys}})
+
+    def _update_credprops_anyscope(self, creds):
+        """Set and unset properties of any number of credentials
+
+        Properties are set in the global scope, and unset in any scope.
+        The config is reloaded afterwards. This method does not modify the
+        keystore.
+
+        Parameters
+        ----------
+        creds: dict
+          Mapping of credential names to dicts with property name/value
+          pairs. A value of ``None`` unsets a property.
+        """
+        changes = {}
+        for name, props in creds.items():
+            props = {
+                k: v for k, v in props.items()
+                if v is not None or _get_cred_cfg_var(name, k) in self._cfg
+            }
+            if props:
+                changes[name] = props
+        if changes:
+            self._set_credprops_global(changes)
+        # anything that is still around is defined in another scope
+        unset_vars = []
         nonremoved_vars = []
-        for k in keys:
-            var = _get_cred_cfg_var(name, k)
-            if var not in self._cfg:
-                continue
-            try:
-                self._cfg.unset(var, scope='global', reload=False)
-            except CommandError as e:
-                CapturedException(e)
+        for name, props in changes.items():
+            for k, v in props.items():
+                var = _get_cred_cfg_var(name, k)
+                if v is not None or var not in self._cfg:
+                    continue
                 try:
                     self._cfg.unset(var, scope='local', reload=False)
+                    unset_vars.append(var)
                 except CommandError as e:
                     CapturedException(e)
                     nonremoved_vars.append(var)
+        if unset_vars:
+            self._cfg.reload()
         if nonremoved_vars:
             raise RuntimeError(
                 f"Cannot remove configuration items {nonremoved_vars} "
                 f"for credential, defined outside global or local "
                 "configuration scope. Remove manually")
-        self._cfg.reload()
+
+    def _set_credprops_global(self, creds):
+        """Set and unset credential properties in the global scope
+
+        Git has no means to change several variables with a single
+        ``git config`` call. Hence one call per property is made, but the
+        config is only reloaded once, after all changes were applied.
+
+        Parameters
+        ----------
+        creds: dict
+          Mapping of credential names to dicts with property name/value
+          pairs. A value of ``None`` unsets a property.
+        """
+        existed = _get_global_gitconfig_path().exists()
+        for name, props in creds.items():
+            for k, v in props.items():
+                var = _get_cred_cfg_var(name, k)
+                if v is not None:
+                    self._cfg.set(
+                        var, v, scope='global', force=True, reload=False)
+                    continue
+                try:
+                    self._cfg.unset(var, scope='global', reload=False)
+                except CommandError as e:
+                    # not defined in this scope
+                    CapturedException(e)
+        # a new file is not detected as a change by a regular reload
+        self._cfg.reload(force=not existed)
 
     def _get_legacy_field_from_keyring(self, name, type_hint):
         if not type_hint or type_hint not in self._cred_types:
@@ -568,7 +821,7 @@ class CredentialManager(object):
         for field in (lc['fields'] or []):
             if field == lc['secret']:
                 continue
-            val = self._keyring.get(name, field)
+            val = self._get_from_keyring(name, field)
             if val:
                 # legacy credentials used property names with underscores,
                 # but this is no longer syntax-compliant -- fix on read
@@ -592,7 +845,7 @@ class CredentialManager(object):
           could be found. Otherwise, the secret is returned.
         """
         # always get the uniform
-        secret = self._keyring.get(name, 'secret')
+        secret = self._get_from_keyring(name, 'secret')
         if secret:
             return secret
         # fall back on a different "field" that is inferred from the
@@ -605,9 +858,33 @@ class CredentialManager(object):
         secret = self._cfg.get(_get_cred_cfg_var(name, secret_field))
         if secret is not None:
             return secret
-        secret = self._keyring.get(name, secret_field)
+        secret = self._get_from_keyring(name, secret_field)
         return secret
 
+    def _get_from_keyring(self, name, field):
+        """Keyring lookup via the process-wide cache"""
+        if self.__cache_ttl is None:
+            self.__cache_ttl = self._cfg.obtain(
+                'datalad.credentials.cache-ttl')
+        return _keyring_cache.get(
+            self._keyring, name, field, self.__cache_ttl, self._cache_daemon)
+
+    @property
+    def _cache_daemon(self):
+        """Client of the credential cache daemon, if enabled"""
+        if self.__cache_daemon is None:
+            self.__cache_daemon = False
+            if hasattr(socket, 'AF_UNIX') and self._cfg.obtain(
+                    'datalad.credentials.cache-daemon'):
+                from datalad_next.credcache import CredentialCacheClient
+                cfg = self._cfg
+                self.__cache_daemon = CredentialCacheClient(
+                    Path(cfg.obtain('datalad.locations.sockets'))
+                    / 'credential-cache' / 'socket',
+                    cfg.obtain('datalad.credentials.cache-daemon-timeout'),
+                )
+        return self.__cache_daemon or None
+
     @property
     def _cfg(self):
         """Return a ConfigManager given to __init__() or the global datalad.cfg
@@ -635,7 +912,7 @@ class CredentialManager(object):
 
         Returns
         -------
-        dict
+        Mapping
           Legacy credential type name ('token', 'user_password', etc.) as keys,
           and dictionaries as values. Each of these dicts has two keys:
           'fields' (the complete list of "fields" that the credential
@@ -643,39 +920,333 @@ class CredentialManager(object):
           secret. If there is no secret, the value associated with that key is
           ``None``.
         """
-        # at present the credential type specifications are built from the
-        # legacy credential types, but this may change at any point in the
-        # future
-        # here is what that was in Mar 2022
-        # 'user_password': {'fields': ['user', 'password'],
-        #                   'secret': 'password'},
-        # 'token':  {'fields': ['token'], 'secret': 'token'},
-        # 'git':    {'fields': ['user', 'password'], 'secret': 'password'}
-        # 'aws-s3': {'fields': ['key_id', 'secret_id', 'session', 'expiration'],
-        #            'secret': 'secret_id'},
-        # 'nda-s3': {'fields': None, 'secret': None},
-        # 'loris-token': {'fields': None, 'secret': None},
-
-        if self.__cred_types:
-            return self.__cred_types
-
-        from datalad.downloaders import CREDENTIAL_TYPES
-        mapping = {}
-        for cname, ctype in CREDENTIAL_TYPES.items():
-            secret_fields = [
-                f for f in (ctype._FIELDS or {})
-                if ctype._FIELDS[f].get('hidden')
-            ]
-            mapping[cname] = dict(
-                fields=list(ctype._FIELDS.keys()) if ctype._FIELDS else None,
-                secret=secret_fields[0] if secret_fields else None,
-            )
-        self.__cred_types = mapping
-        return mapping
+        # the specifications of known types come from a static table, others
+        # are determined from the legacy credential types in
+        # datalad.downloaders on demand
+        return _credential_types
 
-def _yield_legacy_credential_names():
-    # query is constrained by non-secrets, no constraints means report all
-    # a constraint means *exact* match on all given properties
+
+class _KeyringCache(object):
+    """Process-wide, thread-safe cache of keyring lookups
+
+    Entries are identified by keyring, credential name, and field, and expire
+    after a time-to-live. Lookups that found nothing are cached too.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, keyring, name, field, ttl, daemon=None):
+        """Return a (cached) keyring field value
+
+        Parameters
+        ----------
+        keyring:
+          Keyring to query on a cache miss.
+        name: str
+          Credential name.
+        field: str
+          Field name.
+        ttl: float
+          Time-to-live of a cache entry in seconds. No caching is performed
+          for values less or equal to zero.
+        daemon: CredentialCacheClient, optional
+          Credential cache daemon shared between processes, to consult before
+          the keyring.
+        """
+        key = (keyring, name, field)
+        now = time.monotonic()
+        if ttl > 0:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        value = self._get_uncached(keyring, name, field, daemon)
+        if ttl > 0:
+            with self._lock:
+                self._entries[key] = (now + ttl, value)
+        return value
+
+    def _get_uncached(self, keyring, name, field, daemon):
+        if daemon is None:
+            return keyring.get(name, field)
+        found, value = daemon.get(name, field)
+        if found:
+            return value
+        value = keyring.get(name, field)
+        if value is not None:
+            daemon.store(name, field, value)
+        return value
+
+    def invalidate(self, name, daemon=None):
+        """Remove all entries for a credential
+
+        If a credential cache ``daemon`` is given, its entries are removed
+        too.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == name]:
+                del self._entries[key]
+        if daemon is not None:
+            daemon.erase(name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_keyring_cache = _KeyringCache()
+
+
+# specifications of the legacy credential types in datalad.downloaders
+# (as of datalad 0.17), see _CredentialTypes
+_static_credential_types = {
+    'user_password': dict(fields=['user', 'password'], secret='password'),
+    'aws-s3': dict(
+        fields=['key_id', 'secret_id', 'session', 'expiration'],
+        secret='secret_id'),
+    'nda-s3': dict(fields=None, secret=None),
+    'token': dict(fields=['token'], secret='token'),
+    'loris-token': dict(fields=None, secret=None),
+    'git': dict(fields=['user', 'password'], secret='password'),
+}
+
+
+class _CredentialTypes(Mapping):
+    """Mapping of credential type names to their fields
+
+    Lookups are served from a static table of known types first. Only a
+    lookup of an unknown type triggers a (one-time) introspection of the
+    legacy credential types in ``datalad.downloaders``, which is expensive
+    to import.
+    """
+    def __init__(self, types):
+        self._types = dict(types)
+        self._introspected = False
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        try:
+            return self._types[key]
+        except KeyError:
+            if not isinstance(key, str) or self._introspected:
+                raise
+        self._introspect()
+        return self._types[key]
+
+    def __iter__(self):
+        self._introspect()
+        return iter(self._types)
+
+    def __len__(self):
+        self._introspect()
+        return len(self._types)
+
+    def _introspect(self):
+        with self._lock:
+            if self._introspected:
+                return
+            self._introspected = True
+            try:
+                from datalad.downloaders import CREDENTIAL_TYPES
+            except ImportError as e:
+                CapturedException(e)
+                return
+            for cname, ctype in CREDENTIAL_TYPES.items():
+                self._types.setdefault(cname, _get_credential_type_spec(ctype))
+
+
+def _get_credential_type_spec(ctype):
+    """Returns fields and secret field of a legacy credential type"""
+    secret_fields = [
+        f for f in (ctype._FIELDS or {})
+        if ctype._FIELDS[f].get('hidden')
+    ]
+    return dict(
+        fields=list(ctype._FIELDS.keys()) if ctype._FIELDS else None,
+        secret=secret_fields[0] if secret_fields else None,
+    )
+
+
+_credential_types = _CredentialTypes(_static_credential_types)
+
+
+def _index_credential_props(items):
+    """Returns a mapping of credential names to their properties
+
+    Parameters
+    ----------
+    items: iterable
+      Config variable name/value pairs.
+    """
+    prefix = 'datalad.credential.'
+    creds = {}
+    for k, v in items:
+        if not k.startswith(prefix):
+            continue
+        name, _, prop = k[len(prefix):].rpartition('.')
+        creds.setdefault(name, {})[prop] = v
+    return creds
+
+
+class _CredentialPropsCache(object):
+    """Process-wide cache of credential properties indexed by name
+
+    Entries are identified by a snapshot of all credential property items
+    of a config. Taking the snapshot is a plain pass over the config items,
+    but (re)building the index of properties by credential name is only
+    needed when any credential property changed. Only the most recently
+    used snapshots are kept.
+    """
+    maxsize = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # credential items -> index
+        self._entries = {}
+
+    def get(self, items):
+        """Returns the index for config items
+
+        Parameters
+        ----------
+        items: iterable
+          Config variable name/value pairs.
+        """
+        prefix = 'datalad.credential.'
+        items = tuple((k, v) for k, v in items if k.startswith(prefix))
+        with self._lock:
+            index = self._entries.pop(items, None)
+            if index is not None:
+                # mark as most recently used
+                self._entries[items] = index
+                return index
+        index = _index_credential_props(items)
+        with self._lock:
+            self._entries[items] = index
+            while len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_credential_props_cache = _CredentialPropsCache()
+
+
+class _LazySecretCredential(dict):
+    """Credential record that retrieves its secret on first access
+
+    Any access to the ``secret`` property, or to the record as a whole
+    (iteration, comparison, etc.), triggers the retrieval. If no secret is
+    found, the ``secret`` property is ``None``.
+    """
+    def __init__(self, props, get_secret):
+        super().__init__(props)
+        self._get_secret = get_secret
+
+    def _materialize(self):
+        if self._get_secret is not None:
+            get_secret = self._get_secret
+            self._get_secret = None
+            super().__setitem__('secret', get_secret())
+
+    def __getitem__(self, key):
+        if key == 'secret':
+            self._materialize()
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if key == 'secret':
+            self._get_secret = None
+        super().__setitem__(key, value)
+
+    def __contains__(self, key):
+        if key == 'secret':
+            self._materialize()
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == 'secret':
+            self._materialize()
+        return super().get(key, default)
+
+    def __iter__(self):
+        self._materialize()
+        return super().__iter__()
+
+    def __len__(self):
+        self._materialize()
+        return super().__len__()
+
+    def __eq__(self, other):
+        self._materialize()
+        return super().__eq__(other)
+
+    def __repr__(self):
+        self._materialize()
+        return super().__repr__()
+
+    def keys(self):
+        self._materialize()
+        return super().keys()
+
+    def values(self):
+        self._materialize()
+        return super().values()
+
+    def items(self):
+        self._materialize()
+        return super().items()
+
+    def copy(self):
+        self._materialize()
+        return dict(self)
+
+    def pop(self, key, *args):
+        if key == 'secret':
+            self._materialize()
+        return super().pop(key, *args)
+
+
+def _get_legacy_provider_files():
+    """Return paths and modification times of all provider config files
+
+    The set of directories considered mirrors
+    ``datalad.downloaders.providers.Providers._get_providers_dirs()``, but
+    is determined without importing ``datalad.downloaders``.
+    """
+    from glob import glob
+    from importlib.util import find_spec
+    from os.path import join as opj
+    from datalad.interface.common_cfg import dirs
+    from datalad.utils import get_dataset_root
+
+    provider_dirs = [
+        opj(d, 'configs')
+        for d in find_spec('datalad.downloaders').submodule_search_locations
+    ]
+    dsroot = get_dataset_root('')
+    if dsroot is not None:
+        provider_dirs.append(opj(dsroot, '.datalad', 'providers'))
+    provider_dirs.extend(
+        opj(d, 'providers')
+        for d in (dirs.site_config_dir, dirs.user_config_dir) if d
+    )
+    files = []
+    for d in provider_dirs:
+        for f in sorted(glob(opj(d, '*.cfg'))):
+            try:
+                files.append((f, os.stat(f).st_mtime_ns))
+            except OSError:
+                # vanished in the meantime, discovery will not see it either
+                continue
+    return tuple(files)
+
+
+def _discover_legacy_credential_names():
     from datalad.downloaders.providers import (
         Providers,
         CREDENTIAL_TYPES,
@@ -684,11 +1255,34 @@ def _yield_legacy_credential_names():
 
     legacy_credentials = set(
         (p.credential.name, type(p.credential))
-        for p in Providers.from_config_files()
+        for p in Providers.from_config_files(reload=True)
         if p.credential
     )
-    for name, type_ in legacy_credentials:
-        yield (name, type_hints.get(type_))
+    return [
+        (name, type_hints.get(type_))
+        for name, type_ in legacy_credentials
+    ]
+
+
+# provider config files (with mtimes) -> discovered legacy credentials
+_legacy_credential_names_cache = {}
+
+
+def _yield_legacy_credential_names():
+    # query is constrained by non-secrets, no constraints means report all
+    # a constraint means *exact* match on all given properties
+    #
+    # discovery is expensive (heavy import, reading and parsing of all
+    # provider configs), so it is only redone when the set of provider
+    # config files, or any of their modification times changed
+    provider_files = _get_legacy_provider_files()
+    names = _legacy_credential_names_cache.get(provider_files)
+    if names is None:
+        names = _discover_legacy_credential_names()
+        # only the latest state is worth keeping
+        _legacy_credential_names_cache.clear()
+        _legacy_credential_names_cache[provider_files] = names
+    yield from names
 
 
 def verify_property_names(names):
@@ -728,3 +1322,18 @@ def _get_cred_cfg_var(name, prop):
     str
     """
     return f'datalad.credential.{name}.{prop}'
+
+
+def _get_global_gitconfig_path():
+    """Return the path of the file Git writes global configuration to"""
+    path = os.environ.get('GIT_CONFIG_GLOBAL')
+    if path:
+        return Path(path).expanduser()
+    gitconfig = Path.home() / '.gitconfig'
+    if not gitconfig.exists():
+        xdg_config = Path(
+            os.environ.get('XDG_CONFIG_HOME') or Path.home() / '.config'
+        ) / 'git' / 'config'
+        if xdg_config.exists():
+            return xdg_config
+    return gitconfig
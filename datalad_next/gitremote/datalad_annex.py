@@ -58,11 +58,19 @@ specifications are support.
 
 Caution with collaborative workflows
 
-There is no protection against simultaneous, conflicting repository state
-uploads from two different locations! Similar to git-annex's "export"
-feature, this feature is most appropriately used as a dataset deposition
-mechanism, where uploads are conducted from a single site only -- deposited
-for consumption by any number of parties.
+By default, there is no protection against simultaneous, conflicting
+repository state uploads from two different locations! Similar to git-annex's
+"export" feature, this feature is most appropriately used as a dataset
+deposition mechanism, where uploads are conducted from a single site only --
+deposited for consumption by any number of parties.
+
+With the ``dlaconcurrency=optimistic`` URL parameter, a push checks right
+before the upload whether the remote repository state is still the one that
+was retrieved at the start of the push. If another party has pushed in the
+meantime, the push is aborted without uploading the repository archive. The
+changes of the other party can then be fetched and integrated, before
+pushing again. This check narrows the window for conflicting uploads
+considerably, but it cannot rule them out entirely.
 
 If this Git remote helper is to be used for multi-way collaboration, with two
 or more parties contributing updates, it is advisable to employ a separate
@@ -109,6 +117,23 @@ this::
 The default LZMA-compression of the ZIP file (in both export and normal mode)
 can be turned off with the ``dladotgit=uncompressed`` URL parameter.
 
+Before it is archived, the repository is packed into a single pack with
+reachability bitmaps, a commit-graph, and a multi-pack-index. These are
+included in the ZIP file, and enable Git to serve clones and fetches from a
+deposited repository without walking its entire history.
+
+
+Shallow and partial clones
+
+Git's shallow (e.g., ``--depth 1``) and partial clone (e.g.,
+``--filter=blob:none``) negotiation is supported. Git negotiates such
+requests with the local mirror of the remote repository (see implementation
+details below), and only transfers the requested objects into the clone.
+Objects missing from a partial clone are fetched on-demand from the mirror
+later on. However, the deposited ZIP archive does not support selective
+retrieval of objects. Hence the full archive is still downloaded to populate
+the mirror -- only once per remote state.
+
 
 Credential handling
 
@@ -148,6 +173,12 @@ fetch/push Git operations are performed locally between the repo (R) and
 repo (B). On push, repo (B) is then packed up again, and deposited on the
 remote site via git-annex transfer in repo (A).
 
+For ``directory``, ``web``, and ``webdav`` special remotes without
+encryption, the remote state is revalidated cheaply (via file stat, or HTTP
+ETag/Last-Modified headers) before it is retrieved. If it did not change
+since the last fetch or push, no download takes place, and repo (A) is not
+even created.
+
 Due to a limitation of this implementation, it is possible that when the last
 upload step fails, Git nevertheless advances the pushed refs, making it appear
 as if the push was completely successful. That being said, Git will still issue
@@ -184,6 +215,9 @@ upload.
 __all__ = ['RepoAnnexGitRemote']
 
 import datetime
+from email.utils import parsedate_to_datetime
+import hashlib
+import json
 import logging
 import os
 import sys
@@ -217,6 +251,7 @@ from datalad_next.credman import CredentialManager
 from datalad_next.utils import (
     get_specialremote_credential_envpatch,
     get_specialremote_credential_properties,
+    get_specialremote_param_dict,
     needs_specialremote_credential_envpatch,
     specialremote_credential_envmap,
     update_specialremote_credential,
@@ -253,9 +288,18 @@ class RepoAnnexGitRemote(object):
     support_githelper_options = {
         'verbosity': EnsureInt(),
     }
+    # configuration for serving fetches from the mirror repo. Enables
+    # partial clones (`--filter`), and the on-demand retrieval of individual
+    # objects that are missing in such clones. Shallow clones need no
+    # special setup
+    upload_pack_config = (
+        'uploadpack.allowFilter=true',
+        'uploadpack.allowAnySHA1InWant=true',
+    )
     # supported parameters that can come in via the URL, but must not
     # be relayed to `git annex initremote`
-    internal_parameters = ('dladotgit=uncompressed', 'dlacredential=')
+    internal_parameters = (
+        'dladotgit=uncompressed', 'dlacredential=', 'dlaconcurrency=')
 
     def __init__(self,
                  gitdir,
@@ -297,9 +341,15 @@ class RepoAnnexGitRemote(object):
         self._repoannex = None
         self._mirrorrepodir = self.workdir / 'mirrorrepo'
         self._mirrorrepo = None
+        # remote refs as last retrieved by any process, together with a
+        # validator that identifies the state of the remote at that time
+        self._refs_cache_file = self.workdir / 'reporefs.cache'
 
         # cache for remote refs, to avoid repeated queries
         self._cached_remote_refs = None
+        # checksum of the remote refs as first retrieved by this process,
+        # for detecting concurrent remote updates
+        self._remote_refs_checksum = None
 
         self.instream = instream
         self.outstream = outstream
@@ -388,9 +438,10 @@ class RepoAnnexGitRemote(object):
             credprops = get_specialremote_credential_properties(
                 self.initremote_params) or {}
             if credprops:
-                creds = self.credman.query(_sortby='last-used', **credprops)
-                if creds:
-                    name, cred = creds[0]
+                match = self.credman.query_first(
+                    _sortby='last-used', **credprops)
+                if match:
+                    name, cred = match
         if not cred:
             # credential query failed too, enable manual entry
             credprops['type'] = 'user_password'
@@ -701,7 +752,9 @@ class RepoAnnexGitRemote(object):
                 # the `self.mirrorrepo` access will ensure that the mirror
                 # is uptodate
                 self.mirrorrepo._git_runner.run(
-                    ['git', 'upload-pack', self.mirrorrepo.path],
+                    ['git']
+                    + [a for c in self.upload_pack_config for a in ('-c', c)]
+                    + ['upload-pack', self.mirrorrepo.path],
                     protocol=NoCapture,
                 )
                 # everything has worked, if we used a credential, update it
@@ -733,7 +786,9 @@ class RepoAnnexGitRemote(object):
         """Package the local mirrorrepo up, and copy to the special remote
 
         The mirror is assumed to be ready/complete. It will be cleaned with
-        `gc` to minimize the upload size. The mirrorrepo is then compressed
+        `gc` to minimize the upload size, and reachability bitmaps, a
+        commit-graph, and a multi-pack-index are written (see
+        `optimize_repo()`). The mirrorrepo is then compressed
         into an LZMA ZIP archive, and a separate refs list for it is created
         in addition. Both are then copied to the special remote.
         """
@@ -741,8 +796,30 @@ class RepoAnnexGitRemote(object):
         mirrorrepo = self.mirrorrepo
         repoannex = self.repoannex
 
-        # trim it down, as much as possible
-        mirrorrepo.call_git(['gc'])
+        # trim it down, as much as possible, and equip it with indices
+        # that make serving clones/fetches from an extracted mirror fast
+        optimize_repo(mirrorrepo)
+
+        # use our zipfile wrapper to get an LZMA compressed archive
+        # via the shutil convenience layer
+        with patch('zipfile.ZipFile',
+                   UncompressedZipFile
+                   if 'dladotgit=uncompressed' in self.initremote_params
+                   else LZMAZipFile):
+            # TODO exclude hooks (the mirror is always plain-git),
+            # would we ever need any
+            archive_file = make_archive(
+                str(self.workdir / 'repoarchive'),
+                'zip',
+                root_dir=str(mirrorrepo.path),
+                base_dir=os.curdir,
+            )
+
+        if 'dlaconcurrency=optimistic' in self.initremote_params:
+            # last chance to find out whether someone else pushed
+            # since we started, before anything is modified at the
+            # remote
+            self.ensure_remote_refs_unchanged()
 
         # update the repo state keys
         # it is critical to drop the local keys first, otherwise
@@ -762,26 +839,12 @@ class RepoAnnexGitRemote(object):
             self.log(repoannex.call_annex([
                 'dropkey', '--force', self.refs_key, self.repo_export_key]))
 
-        # use our zipfile wrapper to get an LZMA compressed archive
-        # via the shutil convenience layer
-        with patch('zipfile.ZipFile',
-                   UncompressedZipFile
-                   if 'dladotgit=uncompressed' in self.initremote_params
-                   else LZMAZipFile):
-            # TODO exclude hooks (the mirror is always plain-git),
-            # would we ever need any
-            archive_file = make_archive(
-                str(self.workdir / 'repoarchive'),
-                'zip',
-                root_dir=str(mirrorrepo.path),
-                base_dir=os.curdir,
-            )
-            # hand over archive to annex
-            repoannex.call_annex([
-                'setkey',
-                self.repo_export_key,
-                archive_file
-            ])
+        # hand over archive to annex
+        repoannex.call_annex([
+            'setkey',
+            self.repo_export_key,
+            archive_file
+        ])
         # generate a list of refs
         # write to file
         refs_file = self.workdir / 'reporefs'
@@ -818,6 +881,10 @@ class RepoAnnexGitRemote(object):
         # update remote refs from local ones
         # we just updated the remote from local
         self._cached_remote_refs = self.get_mirror_refs()
+        # and spare the next process the download of what we just uploaded
+        self._set_refs_cache(
+            self._cached_remote_refs,
+            self._get_remote_refs_validator())
 
     def replace_mirrorrepo_from_remote_deposit_if_needed(self):
         """Replace the mirror if the remote has refs and they differ
@@ -905,6 +972,134 @@ class RepoAnnexGitRemote(object):
             # this process already queried them once, return cache
             return self._cached_remote_refs
 
+        refs = None
+        # if possible, check cheaply whether the refs at the remote are
+        # still those obtained by a previous process
+        validator = self._get_remote_refs_validator()
+        if validator:
+            refs = self._get_refs_cache(validator)
+        if refs is None:
+            refs = self._fetch_remote_refs()
+            self._set_refs_cache(refs, validator)
+        if self._remote_refs_checksum is None:
+            # remember what the remote looked like when we first
+            # looked at it
+            self._remote_refs_checksum = _get_refs_checksum(refs)
+        # cache, return
+        self._cached_remote_refs = refs
+        return refs
+
+    def ensure_remote_refs_unchanged(self):
+        """Verify that the remote refs did not change since first retrieval
+
+        The refs are retrieved from the remote again, regardless of any
+        cached information. Only this small key is transferred.
+
+        Raises
+        ------
+        RuntimeError
+          If the remote refs differ from those retrieved first by this
+          process, indicating a concurrent update of the remote.
+        """
+        self.log("Check for concurrent remote update")
+        if self._remote_refs_checksum is None:
+            # we never looked, nothing to compare against
+            return
+        if _get_refs_checksum(self._fetch_remote_refs()) \
+                != self._remote_refs_checksum:
+            raise RuntimeError(
+                'Remote repository state changed since it was retrieved, '
+                'likely due to a concurrent push. Not overwriting. '
+                'Fetch and integrate the remote changes, and push again.')
+
+    def _get_remote_refs_validator(self):
+        """Determine a validator for the refs currently at the remote
+
+        A validator is a string that changes whenever the content of the
+        refs key at the remote changes. It can be determined without
+        downloading the key and without git-annex. This is only possible
+        for a few special remote types: ``directory`` (file stat),
+        and ``web`` and ``webdav`` (HTTP ETag or Last-Modified header).
+        For encrypted remotes no validator can be determined.
+
+        Returns
+        -------
+        str or None
+          `None` is returned when no validator can be determined for
+          the special remote, or the remote does not have refs.
+        """
+        params = get_specialremote_param_dict(self.initremote_params)
+        remote_type = params.get('type')
+        kinfo = self.xdlra_key_locations[self.refs_key]
+        refs_relpath = kinfo['loc'] \
+            if params.get('exporttree') == 'yes' \
+            else f'{kinfo["prefix"]}/{self.refs_key}/{self.refs_key}'
+        try:
+            if remote_type == 'directory' \
+                    and params.get('encryption') == 'none' \
+                    and params.get('directory'):
+                st = (Path(params['directory']) / refs_relpath).stat()
+                return f'stat:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}'
+            elif remote_type == 'web' or (
+                    remote_type == 'webdav'
+                    and params.get('encryption') == 'none'):
+                if not params.get('url'):
+                    return
+                env = dict(os.environ, **(self.credential_env or {}))
+                auth = (env['WEBDAV_USERNAME'], env['WEBDAV_PASSWORD']) \
+                    if remote_type == 'webdav' \
+                    and 'WEBDAV_USERNAME' in env \
+                    and 'WEBDAV_PASSWORD' in env \
+                    else None
+                return _get_http_validator(
+                    f'{params["url"]}/{refs_relpath}', auth=auth)
+        except OSError as e:
+            # any failure to probe just means that we need to download.
+            # this also covers all exceptions raised by `requests`
+            CapturedException(e)
+            self.log('Could not determine remote refs validator', level=4)
+        return
+
+    def _get_refs_cache(self, validator):
+        """Return the refs recorded for a remote refs validator
+
+        Returns
+        -------
+        str or None
+          `None` is returned if no refs are on record for this validator.
+        """
+        try:
+            cache = json.loads(self._refs_cache_file.read_text())
+        except (OSError, ValueError) as e:
+            CapturedException(e)
+            return
+        if cache.get('validator') != validator:
+            return
+        self.log('Remote refs unchanged, using local copy')
+        return cache.get('refs')
+
+    def _set_refs_cache(self, refs, validator):
+        """Record refs and their validator for use by a future process
+
+        Any previous record is removed, if either `refs` or `validator`
+        is `None`.
+        """
+        if refs is None or validator is None:
+            if self._refs_cache_file.exists():
+                self._refs_cache_file.unlink()
+            return
+        self._ensure_workdir()
+        self._refs_cache_file.write_text(
+            json.dumps(dict(validator=validator, refs=refs)))
+
+    def _fetch_remote_refs(self):
+        """Download the refs key from the remote, ignoring any cache
+
+        Returns
+        -------
+        str or None
+          Refs as a string, or `None` if the remote has no refs.
+        """
         self.log("Get refs from remote")
         ra = self.repoannex
 
@@ -932,10 +1127,7 @@ class RepoAnnexGitRemote(object):
 
         refskeyloc = ra.call_annex_oneline([
             'contentlocation', self.refs_key])
-        # read, cache, return
-        refs = (ra.dot_git / refskeyloc).read_text()
-        self._cached_remote_refs = refs
-        return refs
+        return (ra.dot_git / refskeyloc).read_text()
 
     def get_mirror_refs(self):
         """Return the refs of the current mirror repo
@@ -1016,6 +1208,105 @@ def _format_refs(repo, refs=None):
     return refstr
 
 
+def optimize_repo(repo):
+    """Compact a repository and write indices for fast object enumeration
+
+    All objects are packed into a single pack via ``git gc``, with a
+    reachability bitmap for this pack. In addition, a commit-graph and a
+    multi-pack-index are written. All these files are placed inside the
+    repository's object store, and are therefore included in a deposited
+    repository archive. A ``git upload-pack`` process serving a clone or
+    fetch from an extracted archive can then use them, instead of walking
+    the entire history for determining the objects to send.
+
+    Only the ``gc`` run is mandatory. Failure to write any of the additional
+    indices (e.g., with an older Git version that does not support them) is
+    logged, but does not cause an exception.
+
+    Parameters
+    ----------
+    repo: GitRepo
+      Repository to optimize. This is expected to be a bare repository.
+    """
+    # bitmaps are written by default for bare repos, but be explicit to
+    # not depend on Git's default. The hash cache speeds up delta-base
+    # selection when serving from the bitmap
+    repo.call_git([
+        '-c', 'repack.writeBitmaps=true',
+        '-c', 'pack.writeBitmapHashCache=true',
+        '-c', 'gc.writeCommitGraph=true',
+        'gc',
+    ])
+    for cmd in (
+            # gc would have written one already (if supported), but
+            # only when it is configured to do so
+            ['commit-graph', 'write', '--reachable'],
+            ['multi-pack-index', 'write'],
+    ):
+        try:
+            repo.call_git(cmd)
+        except CommandError as e:
+            CapturedException(e)
+            lgr.debug('Could not write repository index via %r', cmd)
+
+
+def _get_http_validator(url, auth=None, timeout=10.0):
+    """Determine a validator for the content at a URL via a HEAD request
+
+    Parameters
+    ----------
+    url: str
+    auth: tuple, optional
+      User name and password for HTTP basic authentication.
+    timeout: float, optional
+      Maximum time to wait for a server response.
+
+    Returns
+    -------
+    str or None
+      The value of the ETag header, or if there is none, the Last-Modified
+      header. `None` is returned if the request was not successful, or
+      the server reported neither header. A Last-Modified header is also
+      ignored, if it is not at least one second older than the server's
+      Date header, because any later modification within the same second
+      would go unnoticed (RFC 7232, section 2.2.2).
+    """
+    import requests
+    r = requests.head(url, auth=auth, allow_redirects=True, timeout=timeout)
+    if r.status_code != 200:
+        return
+    if r.headers.get('etag'):
+        return f'etag:{r.headers["etag"]}'
+    lastmod = r.headers.get('last-modified')
+    date = r.headers.get('date')
+    if not lastmod or not date:
+        return
+    try:
+        if (parsedate_to_datetime(date)
+                - parsedate_to_datetime(lastmod)).total_seconds() < 1:
+            return
+    except (TypeError, ValueError):
+        # unparsable dates, cannot judge
+        return
+    return f'last-modified:{lastmod}:{r.headers.get("content-length")}'
+
+
+def _get_refs_checksum(refs):
+    """Return a checksum for a refs list
+
+    Parameters
+    ----------
+    refs: str or None
+      As returned by `RepoAnnexGitRemote.get_remote_refs()`. `None`
+      (no refs at the remote) yields a checksum too.
+
+    Returns
+    -------
+    str
+    """
+    return hashlib.sha256((refs or '').encode('utf-8')).hexdigest()
+
+
 def get_initremote_params_from_url(url):
     """Parse a remote URL for initremote parameters
 
@@ -1231,7 +1522,9 @@ def main():
         # leaving the table clean and always bootstrap from scratch
         # has the advantage that we always automatically react to any
         # git-remote reconfiguration between runs
-        rmtree(remote.repoannex.path, ignore_errors=True)
+        # do not use the `repoannex` property, it would bootstrap a new
+        # repo annex, if none was needed for this run
+        rmtree(str(remote._repoannexdir), ignore_errors=True)
     except Exception as e:
         ce = CapturedException(e)
         # Receiving an exception here is "fatal" by definition.
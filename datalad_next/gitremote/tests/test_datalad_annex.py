@@ -10,8 +10,10 @@
 
 """
 
+import os
 from pathlib import Path
 from stat import S_IREAD, S_IRGRP, S_IROTH
+import time
 from unittest.mock import patch
 
 from datalad.api import (
@@ -19,9 +21,11 @@ from datalad.api import (
     clone,
 )
 from datalad.runner import CommandError
+from datalad.support.gitrepo import GitRepo
 from datalad.tests.utils_pytest import (
     DEFAULT_BRANCH,
     DEFAULT_REMOTE,
+    assert_in,
     assert_raises,
     assert_status,
     eq_,
@@ -35,7 +39,11 @@ from datalad_next.tests.utils import (
     serve_path_via_webdav,
     with_credential,
 )
-from ..datalad_annex import get_initremote_params_from_url
+from ..datalad_annex import (
+    RepoAnnexGitRemote,
+    get_initremote_params_from_url,
+    optimize_repo,
+)
 
 
 webdav_cred = ('datalad', 'secure')
@@ -231,6 +239,46 @@ def _check_repush_after_vanish(ds, remoteurl, remotepath):
     eq_dla_branch_state(dsrepo.get_hexsha(DEFAULT_BRANCH), remotepath)
 
 
+@with_tempfile
+@with_tempfile(mkdir=True)
+@with_tempfile
+@with_tempfile
+def test_shallow_partial_clone(dspath=None, remotepath=None,
+                               shallowpath=None, partialpath=None):
+    # bypass the complications of folding a windows path into a file URL
+    dlaurl = \
+        f'datalad-annex::?type=directory&directory={remotepath}&encryption=none' \
+        if on_windows else \
+        f'datalad-annex::file://{remotepath}?type=directory&directory={{path}}&encryption=none'
+    ds = Dataset(dspath).create(annex=False, result_renderer='disabled')
+    for i in range(3):
+        (ds.pathobj / f'file{i}').write_text(f'content{i}')
+        ds.save(result_renderer='disabled')
+    dsrepo = ds.repo
+    dsrepo.call_git(['remote', 'add', 'dla', dlaurl])
+    dsrepo.call_git(['push', '-u', 'dla', DEFAULT_BRANCH])
+
+    dsrepo.call_git(['clone', '--depth', '1', dlaurl, shallowpath])
+    shallow = GitRepo(shallowpath)
+    eq_(dsrepo.get_hexsha(DEFAULT_BRANCH), shallow.get_hexsha(DEFAULT_BRANCH))
+    # only the tip commit was transferred
+    eq_(shallow.call_git(['rev-list', '--count', 'HEAD']).strip(), '1')
+    assert (shallow.dot_git / 'shallow').exists()
+
+    dsrepo.call_git([
+        'clone', '--no-checkout', '--filter=blob:none', dlaurl, partialpath])
+    partial = GitRepo(partialpath)
+    eq_(dsrepo.get_hexsha(DEFAULT_BRANCH), partial.get_hexsha(DEFAULT_BRANCH))
+    # the filter was honored, blobs are missing
+    assert any(
+        line.startswith('?') for line in partial.call_git([
+            'rev-list', '--objects', '--all', '--missing=print',
+        ]).splitlines())
+    # but can be obtained on-demand
+    partial.call_git(['checkout', DEFAULT_BRANCH])
+    eq_((partial.pathobj / 'file2').read_text(), 'content2')
+
+
 def test_params_from_url():
     f = get_initremote_params_from_url
     # just the query part being used
@@ -374,3 +422,188 @@ def test_webdav_auth(preppath=None, clnpath=None, remotepath=None, webdavurl=Non
     # must give the same thing
     eq_(ds.repo.get_hexsha(DEFAULT_BRANCH),
         cln.repo.get_hexsha(DEFAULT_BRANCH))
+
+
+@with_tempfile
+@with_tempfile
+def test_optimize_repo(srcpath=None, mirrorpath=None):
+    ds = Dataset(srcpath).create(annex=False, result_renderer='disabled')
+    for i in range(3):
+        (ds.pathobj / f'file{i}').write_text(f'content{i}')
+        ds.save(result_renderer='disabled')
+    mirror = GitRepo(mirrorpath, create=True, bare=True)
+    ds.repo.call_git(['push', '--mirror', mirrorpath])
+    optimize_repo(mirror)
+    objdir = Path(mirrorpath) / 'objects'
+    packs = list((objdir / 'pack').glob('*.pack'))
+    # everything is in a single pack
+    eq_(len(packs), 1)
+    # with a reachability bitmap
+    assert (objdir / 'pack' / f'{packs[0].stem}.bitmap').exists()
+    # a commit-graph, either as a single file or split into a chain
+    assert (objdir / 'info' / 'commit-graph').exists() \
+        or (objdir / 'info' / 'commit-graphs').exists()
+    # and a multi-pack-index
+    assert (objdir / 'pack' / 'multi-pack-index').exists()
+    # the optimized repo is still fully functional
+    eq_(ds.repo.get_hexsha(DEFAULT_BRANCH), mirror.get_hexsha(DEFAULT_BRANCH))
+    mirror.call_git(['fsck', '--no-progress'])
+
+
+@with_tempfile
+def test_concurrency_guard(path=None):
+    repo = GitRepo(path, create=True)
+    remote = RepoAnnexGitRemote(
+        repo.dot_git, 'dla',
+        'datalad-annex::?type=directory&directory=/not/here'
+        '&encryption=none&dlaconcurrency=optimistic')
+    # internal parameter is not passed on to git-annex
+    assert 'dlaconcurrency=optimistic' in remote.initremote_params
+    assert any('dlaconcurrency=optimistic'.startswith(p)
+               for p in remote.internal_parameters)
+
+    refs = 'ca4da8a0d1e4d4f0a37db4d2e4ff3b0d2d5c0001 refs/heads/main\n' \
+        '@refs/heads/main HEAD\n'
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      side_effect=[refs, refs]) as fetch:
+        eq_(remote.get_remote_refs(), refs)
+        # cached, no second fetch
+        eq_(remote.get_remote_refs(), refs)
+        eq_(fetch.call_count, 1)
+        # the check ignores the cache, but finds no change
+        remote.ensure_remote_refs_unchanged()
+        eq_(fetch.call_count, 2)
+    # someone else pushed in the meantime
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      return_value=refs.replace('0001', '0002')):
+        assert_raises(RuntimeError, remote.ensure_remote_refs_unchanged)
+    # or the remote vanished
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      return_value=None):
+        assert_raises(RuntimeError, remote.ensure_remote_refs_unchanged)
+
+    # an initially empty remote must stay empty too
+    remote = RepoAnnexGitRemote(
+        repo.dot_git, 'dla2',
+        'datalad-annex::?type=directory&directory=/not/here'
+        '&encryption=none&dlaconcurrency=optimistic')
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      return_value=None):
+        eq_(remote.get_remote_refs(), None)
+        remote.ensure_remote_refs_unchanged()
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      return_value=refs):
+        assert_raises(RuntimeError, remote.ensure_remote_refs_unchanged)
+
+
+def _check_refs_revalidation(gitdir, url, refsfile):
+    refs = 'ca4da8a0d1e4d4f0a37db4d2e4ff3b0d2d5c0001 refs/heads/main\n' \
+        '@refs/heads/main HEAD\n'
+    refsfile.parent.mkdir(parents=True, exist_ok=True)
+    refsfile.write_text(refs)
+    # make sure that modification times are distinguishable, even with
+    # HTTP's one second resolution
+    now = time.time()
+    os.utime(refsfile, (now - 100, now - 100))
+
+    def _fetch(self):
+        return refsfile.read_text()
+
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      autospec=True, side_effect=_fetch) as fetch:
+        # first contact, must download
+        eq_(RepoAnnexGitRemote(gitdir, 'dla', url).get_remote_refs(), refs)
+        eq_(fetch.call_count, 1)
+        # a new process finds the remote unchanged, no download
+        eq_(RepoAnnexGitRemote(gitdir, 'dla', url).get_remote_refs(), refs)
+        eq_(fetch.call_count, 1)
+        # the remote changes, must download again
+        refsfile.unlink()
+        newrefs = refs.replace('0001', '0002')
+        refsfile.write_text(newrefs)
+        os.utime(refsfile, (now - 50, now - 50))
+        eq_(RepoAnnexGitRemote(gitdir, 'dla', url).get_remote_refs(), newrefs)
+        eq_(fetch.call_count, 2)
+        # the remote vanishes, we must not report anything from the cache
+        refsfile.unlink()
+        fetch.side_effect = None
+        fetch.return_value = None
+        eq_(RepoAnnexGitRemote(gitdir, 'dla', url).get_remote_refs(), None)
+        eq_(fetch.call_count, 3)
+
+
+@with_tempfile
+@with_tempfile(mkdir=True)
+def test_refs_revalidation_directory(path=None, remotepath=None):
+    repo = GitRepo(path, create=True)
+    _check_refs_revalidation(
+        repo.dot_git,
+        f'datalad-annex::?type=directory&directory={remotepath}'
+        '&encryption=none',
+        Path(remotepath, '3f7', '4a3', 'XDLRA--refs', 'XDLRA--refs'),
+    )
+    # export-mode layout
+    _check_refs_revalidation(
+        repo.dot_git,
+        f'datalad-annex::?type=directory&directory={remotepath}'
+        '&encryption=none&exporttree=yes',
+        Path(remotepath, '.datalad', 'dotgit', 'refs'),
+    )
+
+
+@with_tempfile(mkdir=True)
+@serve_path_via_http
+@with_tempfile
+def test_refs_revalidation_web(servepath=None, url=None, path=None):
+    repo = GitRepo(path, create=True)
+    _check_refs_revalidation(
+        repo.dot_git,
+        f'datalad-annex::{url}',
+        Path(servepath, '.datalad', 'dotgit', 'refs'),
+    )
+
+
+@with_tempfile
+@with_tempfile(mkdir=True)
+@with_tempfile
+def test_refs_revalidation_directory_push(
+        dspath=None, remotepath=None, path=None):
+    # revalidation against a remote that git-annex actually wrote
+    dlaurl = f'datalad-annex::?type=directory&directory={remotepath}' \
+        '&encryption=none'
+    ds = Dataset(dspath).create(annex=False, result_renderer='disabled')
+    dsrepo = ds.repo
+    dsrepo.call_git(['remote', 'add', 'dla', dlaurl])
+    dsrepo.call_git(['push', '-u', 'dla', DEFAULT_BRANCH])
+    repo = GitRepo(path, create=True)
+
+    def get_refs():
+        remote = RepoAnnexGitRemote(repo.dot_git, 'dla', dlaurl)
+        return remote, remote.get_remote_refs()
+
+    with patch.object(RepoAnnexGitRemote, '_fetch_remote_refs',
+                      autospec=True,
+                      side_effect=RepoAnnexGitRemote._fetch_remote_refs) \
+            as fetch:
+        remote, refs = get_refs()
+        eq_(fetch.call_count, 1)
+        assert_in(dsrepo.get_hexsha(DEFAULT_BRANCH), refs)
+        # the validator is based on the refs key as laid out by git-annex,
+        # wherever that is
+        refsfiles = [p for p in Path(remotepath).glob('**/XDLRA--refs')
+                     if p.is_file()]
+        eq_(len(refsfiles), 1)
+        st = refsfiles[0].stat()
+        eq_(remote._get_remote_refs_validator(),
+            f'stat:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}')
+        # a new process finds the remote unchanged, no download
+        eq_(get_refs()[1], refs)
+        eq_(fetch.call_count, 1)
+        # a push changes the remote, must download again
+        (ds.pathobj / 'file1').write_text('file1text')
+        assert_status('ok', ds.save(result_renderer='disabled'))
+        dsrepo.call_git(['push', 'dla'])
+        newrefs = get_refs()[1]
+        eq_(fetch.call_count, 2)
+        assert_in(dsrepo.get_hexsha(DEFAULT_BRANCH), newrefs)
+        neq_(newrefs, refs)
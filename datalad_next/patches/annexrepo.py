@@ -64,10 +64,7 @@ def annexRepo__enable_remote(self, name, options=None, env=None):
         credspec = None
         if credprops:
             credman = CredentialManager(self.config)
-            creds = credman.query(_sortby='last-used', **credprops)
-            if creds:
-                # found one
-                credspec = creds[0]
+            credspec = credman.query_first(_sortby='last-used', **credprops)
         # TODO manual entry could be supported here too! (also see at the end)
         if env:
             env.copy()
@@ -35,11 +35,11 @@ def _set_request_headers(self, credential_name, auth_info, require_token):
     credential = None
     if not credential_name:
         # get the most recent credential by realm, because none was identified
-        creds = credman.query(realm=self.api_url, _sortby='last-used')
-        if creds:
+        match = credman.query_first(realm=self.api_url, _sortby='last-used')
+        if match:
             # found one, also assign the name to be able to update
             # it below
-            credential_name, credential = creds[0]
+            credential_name, credential = match
             from_query = True
     if not credential_name:
         # if we have no name given, fall back on a generated one
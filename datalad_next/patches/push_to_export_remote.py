@@ -61,9 +61,9 @@ def _get_credentials(ds: Dataset,
         # TODO: lower prio: factor this if clause out, also used in
         #  create_sibling_webdav.py
         credential_manager = CredentialManager(ds.config)
-        credentials = (credential_manager.query(
+        credentials = (credential_manager.query_first(
             _sortby='last-used',
-            **credential_properties) or [(None, None)])[0][1]
+            **credential_properties) or (None, None))[1]
     return credentials
 
 
@@ -0,0 +1,186 @@
+import os
+from pathlib import Path
+import socket
+import stat
+import tempfile
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from datalad.config import ConfigManager
+from datalad.tests.utils_pytest import (
+    SkipTest,
+    assert_raises,
+    eq_,
+    skip_if_on_windows,
+)
+from datalad.utils import rmtree
+
+from ..credcache import (
+    CredentialCacheClient,
+    CredentialCacheServer,
+    _RequestHandler,
+    _check_private_dir,
+    _check_socket_owner,
+    _ensure_private_dir,
+)
+from ..credman import CredentialManager
+
+
+@pytest.fixture
+def socket_dir():
+    """Temporary directory to place daemon sockets in
+
+    The configured temporary directory for tests is not used, it may be on
+    a file system (e.g. VFAT) that supports neither file modes, nor sockets.
+    """
+    path = Path(tempfile.mkdtemp(
+        prefix='datalad_credcache_',
+        dir=os.environ.get('XDG_RUNTIME_DIR') or '/tmp'))
+    try:
+        path.chmod(0o700)
+        if stat.S_IMODE(path.stat().st_mode) != 0o700:
+            raise SkipTest(f'File modes are not supported at {path}')
+        yield path
+    finally:
+        rmtree(str(path))
+
+
+def _start_server(socket_path, timeout=60):
+    _ensure_private_dir(socket_path.parent)
+    server = CredentialCacheServer(socket_path, timeout)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    return server, thread
+
+
+@skip_if_on_windows
+def test_credcache_daemon(socket_dir):
+    socket_path = socket_dir / 'cache' / 'socket'
+    client = CredentialCacheClient(socket_path, 60, autostart=False)
+    # no daemon, no failure
+    eq_(client.get('cred', 'secret'), (False, None))
+    client.store('cred', 'secret', 'dummy')
+    server, thread = _start_server(socket_path)
+    try:
+        # socket is user-only
+        eq_(os.stat(socket_path.parent).st_mode & 0o077, 0)
+        eq_(os.stat(socket_path).st_mode & 0o077, 0)
+        eq_(client.get('cred', 'secret'), (False, None))
+        client.store('cred', 'secret', 'dummy')
+        client.store('cred', 'user', 'mike')
+        client.store('other', 'secret', 'dummy2')
+        eq_(client.get('cred', 'secret'), (True, 'dummy'))
+        eq_(client.get('cred', 'user'), (True, 'mike'))
+        client.erase('cred')
+        eq_(client.get('cred', 'secret'), (False, None))
+        eq_(client.get('other', 'secret'), (True, 'dummy2'))
+        # entries expire
+        client.timeout = 0
+        client.store('other', 'secret', 'dummy2')
+        eq_(client.get('other', 'secret'), (False, None))
+    finally:
+        client.exit()
+        thread.join()
+    # the daemon cleans up after itself
+    assert not socket_path.exists()
+
+
+@skip_if_on_windows
+def test_credcache_private_dir(socket_dir, monkeypatch):
+    path = socket_dir / 'cache'
+    _ensure_private_dir(path)
+    path.chmod(0o755)
+    assert_raises(PermissionError, _ensure_private_dir, path)
+    path.chmod(0o700)
+    # no means to check ownership, no daemon
+    monkeypatch.delattr(os, 'getuid')
+    assert_raises(PermissionError, _check_private_dir, path)
+    client = CredentialCacheClient(path / 'socket', 60)
+    eq_(client.get('cred', 'secret'), (False, None))
+
+
+@skip_if_on_windows
+def test_credcache_client_checks(socket_dir):
+    socket_path = socket_dir / 'cache' / 'socket'
+    client = CredentialCacheClient(socket_path, 60, autostart=False)
+    server, thread = _start_server(socket_path)
+    try:
+        client.store('cred', 'secret', 'dummy')
+        # a stalled client does not block the daemon for long
+        with patch.object(_RequestHandler, 'timeout', 0.2), \
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+            stalled.connect(str(socket_path))
+            eq_(client.get('cred', 'secret'), (True, 'dummy'))
+        # nothing is sent to a daemon in a directory accessible by others
+        socket_path.parent.chmod(0o755)
+        with patch.object(server, 'process') as process:
+            eq_(client.get('cred', 'secret'), (False, None))
+            process.assert_not_called()
+        socket_path.parent.chmod(0o700)
+        eq_(client.get('cred', 'secret'), (True, 'dummy'))
+        # and not to a socket of another user
+        with patch('datalad_next.credcache._check_private_dir'), \
+                patch('datalad_next.credcache.os.getuid',
+                      return_value=os.getuid() + 1), \
+                patch.object(server, 'process') as process:
+            eq_(client.get('cred', 'secret'), (False, None))
+            process.assert_not_called()
+    finally:
+        client.exit()
+        thread.join()
+    # only sockets qualify
+    (socket_path.parent / 'file').write_text('')
+    assert_raises(
+        PermissionError, _check_socket_owner, socket_path.parent / 'file')
+
+
+@skip_if_on_windows
+def test_credcache_daemon_autostart(socket_dir):
+    socket_path = socket_dir / 'cache' / 'socket'
+    client = CredentialCacheClient(socket_path, 60)
+    try:
+        client.store('cred', 'secret', 'dummy')
+        # a separate client talks to the same daemon
+        eq_(CredentialCacheClient(socket_path, 60, autostart=False).get(
+            'cred', 'secret'),
+            (True, 'dummy'))
+    finally:
+        client.exit()
+
+
+@skip_if_on_windows
+def test_credman_cache_daemon(counting_keyring, socket_dir):
+    socket_path = socket_dir / 'credential-cache' / 'socket'
+    server, thread = _start_server(socket_path)
+    cfg = ConfigManager()
+    overrides = {
+        'datalad.credentials.cache-daemon': 'true',
+        'datalad.locations.sockets': str(socket_dir),
+        # only the daemon caches
+        'datalad.credentials.cache-ttl': '0',
+    }
+    for k, v in overrides.items():
+        cfg.set(k, v, scope='override')
+    try:
+        CredentialManager(cfg).set('daemoncred', secret='dummy')
+        counting_keyring.get_calls = 0
+        # many managers, one keyring lookup, the rest is served by
+        # the daemon
+        for i in range(3):
+            eq_(CredentialManager(cfg).get('daemoncred')['secret'],
+                'dummy')
+        eq_(counting_keyring.get_calls, 1)
+        eq_(server.cache.get('daemoncred', 'secret'), (True, 'dummy'))
+        # updates invalidate the daemon cache too
+        CredentialManager(cfg).set('daemoncred', secret='new')
+        eq_(server.cache.get('daemoncred', 'secret'), (False, None))
+        eq_(CredentialManager(cfg).get('daemoncred')['secret'], 'new')
+        CredentialManager(cfg).remove('daemoncred')
+        eq_(server.cache.get('daemoncred', 'secret'), (False, None))
+    finally:
+        for k in overrides:
+            cfg.unset(k, scope='override')
+        CredentialCacheClient(socket_path, 60, autostart=False).exit()
+        thread.join()
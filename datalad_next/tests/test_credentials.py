@@ -9,7 +9,10 @@
 """
 
 """
+import json
 import logging
+import os
+from pathlib import Path
 from unittest.mock import patch
 
 from datalad.cli.tests.test_main import run_main
@@ -24,6 +27,7 @@ from datalad.tests.utils_pytest import (
     assert_raises,
     eq_,
     swallow_logs,
+    with_tempfile,
     with_testsui,
 )
 
@@ -183,12 +187,76 @@ def test_extreme_credential_name():
     cred = Credentials()
     extreme = 'ΔЙקم๗あ |/;&%b5{}"'
     with patch('datalad.support.keyring_.keyring', MemoryKeyring()):
-        assert_in_results(
-            cred('set',
-                 name=extreme,
-                 # use CLI style spec to exercise more code
-                 spec=[f'someprop={extreme}', f'secret={extreme}'],
-            ),
-            cred_someprop=extreme,
-            cred_secret=extreme,
-        )
+        try:
+            assert_in_results(
+                cred('set',
+                     name=extreme,
+                     # use CLI style spec to exercise more code
+                     spec=[f'someprop={extreme}', f'secret={extreme}'],
+                ),
+                cred_someprop=extreme,
+                cred_secret=extreme,
+            )
+        finally:
+            # do not leave a credential without a secret behind for
+            # subsequent tests
+            cred('remove', name=extreme)
+
+
+@with_tempfile(mkdir=True)
+def test_credentials_import_export(path=None):
+    path = Path(path)
+    cred = Credentials()
+    records = [
+        dict(name=f'bulkcred{i}', secret=f'secret{i}',
+             realm='https://bulk.example.com', user=f'user{i}')
+        for i in range(10)
+    ]
+    infile = path / 'in.jsonl'
+    infile.write_text(
+        '\n'.join(json.dumps(r) for r in records)
+        # broken records are reported, and do not prevent the import
+        + '\n{"name": "nosecret"}\n[1, 2]\nnojson\n')
+    with patch('datalad.support.keyring_.keyring', MemoryKeyring()):
+        try:
+            res = cred('import', file=str(infile), on_failure='ignore')
+            eq_(len([r for r in res if r['status'] == 'error']), 3)
+            for r in records:
+                assert_in_results(
+                    res, status='ok', name=r['name'],
+                    cred_secret=r['secret'], cred_user=r['user'])
+            assert_in_results(
+                cred('get', name='bulkcred3'),
+                cred_secret='secret3', cred_user='user3',
+                cred_realm='https://bulk.example.com')
+            # export of all matching credentials
+            outfile = path / 'out.jsonl'
+            res = cred('export', file=str(outfile),
+                       spec={'realm': 'https://bulk.example.com'})
+            eq_(len(res), len(records))
+            eq_(os.stat(outfile).st_mode & 0o077, 0)
+            exported = sorted(
+                (json.loads(l) for l in outfile.read_text().splitlines()),
+                key=lambda r: r['name'])
+            eq_(exported, sorted(records, key=lambda r: r['name']))
+            # export of a single credential
+            cred('export', name='bulkcred0', file=str(outfile))
+            eq_([json.loads(l) for l in outfile.read_text().splitlines()],
+                [records[0]])
+            # the export can be imported again, here with a change
+            # and a property removal
+            outfile.write_text(json.dumps(
+                dict(records[0], secret='new', user=None)))
+            assert_in_results(
+                cred('import', file=str(outfile)),
+                name='bulkcred0', cred_secret='new', cred_user=None)
+            res = cred('get', name='bulkcred0')
+            assert_in_results(res, cred_secret='new')
+            assert 'cred_user' not in res[0]
+        finally:
+            for r in records:
+                cred('remove', name=r['name'])
+    # no file to export to
+    assert_raises(ValueError, cred, 'export')
+    # nothing but records for import
+    assert_raises(ValueError, cred, 'import', name='some')
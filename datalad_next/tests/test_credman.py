@@ -9,13 +9,23 @@
 """
 
 """
+from pathlib import Path
 from unittest.mock import patch
 
 from datalad.config import ConfigManager
 from datalad.distribution.dataset import Dataset
 from ..credman import (
     CredentialManager,
+    _CredentialTypes,
+    _credential_props_cache,
+    _get_credential_type_spec,
     _get_cred_cfg_var,
+    _get_global_gitconfig_path,
+    _get_legacy_provider_files,
+    _index_credential_props,
+    _keyring_cache,
+    _static_credential_types,
+    _yield_legacy_credential_names,
 )
 from datalad.support.keyring_ import MemoryKeyring
 from datalad.tests.utils_pytest import (
@@ -24,6 +34,7 @@ from datalad.tests.utils_pytest import (
     assert_raises,
     eq_,
     neq_,
+    on_windows,
     patch_config,
     with_tempfile,
 )
@@ -156,3 +167,283 @@ def check_query():
                           _reverse=False)
     eq_(['cred.0', 'cred.1', 'cred.2', 'cred.no.time'],
         [i[0] for i in slist])
+
+
+def test_query_no_keyring_for_mismatches(counting_keyring):
+    cfg = ConfigManager()
+    credman = CredentialManager(cfg)
+    try:
+        for i in range(10):
+            credman.set(
+                f'mismatchcred{i}',
+                secret=f's{i}',
+                realm=f'http://mismatch{i}.example.com',
+            )
+        counting_keyring.get_calls = 0
+        res = credman.query(realm='http://mismatch3.example.com')
+        eq_([r[0] for r in res], ['mismatchcred3'])
+        eq_(res[0][1]['secret'], 's3')
+        # only the matching credential was looked up in the keyring
+        eq_(counting_keyring.get_calls, 1)
+        # no match on properties that are not on record
+        eq_(credman.query(realm='http://mismatch3.example.com',
+                          user='someone'), [])
+        # query by secret still works
+        eq_([r[0] for r in credman.query(secret='s4')],
+            ['mismatchcred4'])
+    finally:
+        for i in range(10):
+            credman.remove(f'mismatchcred{i}')
+
+
+def test_query_lazy_secret(counting_keyring):
+    cfg = ConfigManager()
+    credman = CredentialManager(cfg)
+    try:
+        for i in range(5):
+            credman.set(
+                f'lazycred{i}',
+                _lastused=True,
+                secret=f's{i}',
+                realm='http://lazy.example.com',
+            )
+        counting_keyring.get_calls = 0
+        res = credman.query(
+            realm='http://lazy.example.com', _sortby='last-used',
+            _lazy_secret=True)
+        eq_([r[0] for r in res],
+            [f'lazycred{i}' for i in range(4, -1, -1)])
+        # filtering and sorting did not need any secret
+        eq_(counting_keyring.get_calls, 0)
+        eq_(res[0][1]['secret'], 's4')
+        eq_(counting_keyring.get_calls, 1)
+        # a materialized record is a complete credential record
+        eq_(res[1][1], credman.get('lazycred3'))
+        eq_(credman.query_first(
+            realm='http://lazy.example.com', _sortby='last-used'),
+            ('lazycred4', dict(
+                secret='s4', realm='http://lazy.example.com',
+                **{'last-used': res[0][1]['last-used']})))
+        # a credential without a secret has a secret of None, if
+        # requested lazily
+        counting_keyring.delete('lazycred0', 'secret')
+        res = credman.query(
+            realm='http://lazy.example.com', _lazy_secret=True)
+        eq_(dict(res)['lazycred0']['secret'], None)
+        # and is not reported otherwise
+        res = credman.query(realm='http://lazy.example.com')
+        eq_(sorted(r[0] for r in res),
+            [f'lazycred{i}' for i in range(1, 5)])
+        # the first one with a secret is used
+        for i in range(1, 5):
+            counting_keyring.delete(f'lazycred{i}', 'secret')
+        counting_keyring.set('lazycred2', 'secret', 's2')
+        # the keyring was modified behind the back of the manager
+        _keyring_cache.clear()
+        eq_(credman.query_first(
+            realm='http://lazy.example.com', _sortby='last-used')[0],
+            'lazycred2')
+        counting_keyring.delete('lazycred2', 'secret')
+        _keyring_cache.clear()
+        eq_(credman.query_first(realm='http://lazy.example.com'), None)
+    finally:
+        for i in range(5):
+            credman.remove(f'lazycred{i}')
+
+
+def test_keyring_cache(counting_keyring):
+    cfg = ConfigManager()
+    credman = CredentialManager(cfg)
+    try:
+        credman.set('cachedcred', secret='first', prop='val')
+        counting_keyring.get_calls = 0
+        # many managers, a single keyring lookup
+        for i in range(5):
+            eq_(CredentialManager(cfg).get('cachedcred')['secret'],
+                'first')
+        eq_(counting_keyring.get_calls, 1)
+        # updates invalidate
+        credman.set('cachedcred', secret='second')
+        eq_(CredentialManager(cfg).get('cachedcred')['secret'],
+            'second')
+        # and so does removal
+        credman.remove('cachedcred')
+        eq_(CredentialManager(cfg).get('cachedcred'), None)
+        # caching can be disabled
+        credman.set('cachedcred', secret='third')
+        counting_keyring.get_calls = 0
+        cfg.set('datalad.credentials.cache-ttl', '0', scope='override')
+        try:
+            for i in range(3):
+                CredentialManager(cfg).get('cachedcred')
+        finally:
+            cfg.unset('datalad.credentials.cache-ttl', scope='override')
+        eq_(counting_keyring.get_calls, 3)
+    finally:
+        credman.remove('cachedcred')
+
+
+def test_legacy_credential_names_cache():
+    provider_files = [('/providers/one.cfg', 1)]
+    discovered = []
+
+    def discover():
+        discovered.append(True)
+        return [('legacycred', 'user_password')]
+
+    with patch('datalad_next.credman._get_legacy_provider_files',
+               lambda: tuple(provider_files)), \
+            patch('datalad_next.credman._discover_legacy_credential_names',
+                  discover):
+        for i in range(3):
+            eq_(list(_yield_legacy_credential_names()),
+                [('legacycred', 'user_password')])
+        # discovery ran once
+        eq_(len(discovered), 1)
+        # a new provider config triggers a rediscovery
+        provider_files.append(('/providers/two.cfg', 1))
+        list(_yield_legacy_credential_names())
+        eq_(len(discovered), 2)
+        # and so does a modification
+        provider_files[0] = ('/providers/one.cfg', 2)
+        list(_yield_legacy_credential_names())
+        list(_yield_legacy_credential_names())
+        eq_(len(discovered), 3)
+    # the provider configs shipped with datalad are found
+    assert any(f.endswith('nda.cfg') for f, m in _get_legacy_provider_files())
+
+
+def test_set_batched_config_writes(counting_keyring, git_config_writes):
+    cfg = ConfigManager()
+    credman = CredentialManager(cfg)
+    props = {
+        'p1': 'plain',
+        'p2': ' leading and trailing space ',
+        'p3': 'with "quotes" and \\backslash\\',
+        'p4': 'comment ; chars # here',
+        'p5': 'tab\tand\nnewline',
+        'p6': 'http://example.com',
+    }
+    try:
+        credman.set('batchcred', secret='dummy', **props)
+        # one git-config call per property
+        eq_(len(git_config_writes), len(props))
+        # values round-trip through git-config
+        eq_({k: v for k, v in credman.get('batchcred').items()
+             if k in props},
+            props)
+        eq_(ConfigManager().get('datalad.credential.batchcred.p3'),
+            props['p3'])
+        # updates and removals go to the same single section
+        git_config_writes.clear()
+        with patch.object(cfg, 'reload', wraps=cfg.reload) as reload:
+            credman.set('batchcred', p1='new', p2=None)
+        # a single reload for all changes
+        eq_(reload.call_count, 1)
+        eq_(len(git_config_writes), 2)
+        cred = credman.get('batchcred')
+        eq_(cred['p1'], 'new')
+        assert_not_in('p2', cred)
+        eq_(_get_global_gitconfig_path().read_text().count(
+            '[datalad "credential.batchcred"]'), 1)
+        # removal works the same way
+        credman.remove('batchcred')
+        eq_(credman.get('batchcred'), None)
+    finally:
+        credman.remove('batchcred')
+
+
+def test_credential_props_index(counting_keyring):
+    indexed = []
+
+    def counting_index(items):
+        indexed.append(True)
+        return _index_credential_props(items)
+
+    cfg = ConfigManager()
+    _credential_props_cache.clear()
+    with patch('datalad_next.credman._index_credential_props',
+               counting_index):
+        credman = CredentialManager(cfg)
+        try:
+            credman.set('indexcred', secret='dummy', prop='val')
+            indexed.clear()
+            # many lookups, by many managers, a single index of the config
+            for i in range(3):
+                eq_(CredentialManager(cfg).get('indexcred')['prop'], 'val')
+                assert_in('indexcred', dict(CredentialManager(cfg).query()))
+            eq_(len(indexed), 1)
+            # any change of a credential leads to a new index
+            credman.set('indexcred', prop='new')
+            eq_(CredentialManager(cfg).get('indexcred')['prop'], 'new')
+            eq_(len(indexed), 2)
+            # but not a change of unrelated config
+            cfg.set('user.dummy', 'x', scope='override')
+            eq_(CredentialManager(cfg).get('indexcred')['prop'], 'new')
+            eq_(len(indexed), 2)
+            cfg.unset('user.dummy', scope='override')
+            # a change in any scope is detected, including a change of
+            # a value only
+            cfg.set('datalad.credential.indexcred.prop', 'patched',
+                    scope='override')
+            eq_(CredentialManager(cfg).get('indexcred')['prop'], 'patched')
+            eq_(len(indexed), 3)
+            cfg.unset('datalad.credential.indexcred.prop', scope='override')
+            eq_(CredentialManager(cfg).get('indexcred')['prop'], 'new')
+            # which finds the previous index again
+            eq_(len(indexed), 3)
+        finally:
+            credman.remove('indexcred')
+
+
+def test_credential_types():
+    from datalad.downloaders import CREDENTIAL_TYPES
+    # the static table matches the legacy credential types
+    for cname, spec in _static_credential_types.items():
+        eq_(spec, _get_credential_type_spec(CREDENTIAL_TYPES[cname]))
+    types = _CredentialTypes(_static_credential_types)
+    eq_(types['token'], dict(fields=['token'], secret='token'))
+    assert not types._introspected
+    # no introspection for anything that cannot be a type name
+    eq_(types.get(None), None)
+    assert not types._introspected
+    # unknown types lead to introspection, once
+    with patch.dict(CREDENTIAL_TYPES,
+                    {'custom': CREDENTIAL_TYPES['user_password']}):
+        eq_(types.get('custom'), types['user_password'])
+        assert types._introspected
+        eq_(types.get('unknown'), None)
+    eq_(set(types), set(CREDENTIAL_TYPES).union(['custom']))
+
+
+def test_set_many(counting_keyring, git_config_writes):
+    cfg = ConfigManager()
+    credman = CredentialManager(cfg)
+    creds = {
+        f'manycred{i}': dict(secret=f's{i}', prop=f'v{i}', _internal='x')
+        for i in range(5)
+    }
+    try:
+        updated = credman.set_many(creds)
+        eq_(updated['manycred1'], dict(prop='v1', secret='s1'))
+        # one git-config call per property, no internal ones
+        eq_(len(git_config_writes), 5)
+        for i in range(5):
+            eq_(credman.get(f'manycred{i}'),
+                dict(prop=f'v{i}', secret=f's{i}'))
+        # only changes are reported, besides the secret
+        eq_(credman.set_many({
+            'manycred0': dict(secret='s0', prop='v0'),
+            'manycred1': dict(secret='s1', prop=None),
+        }),
+            {'manycred0': dict(secret='s0'),
+             'manycred1': dict(prop=None, secret='s1')})
+        eq_(credman.get('manycred1'), dict(secret='s1'))
+        # nothing is stored, if any record lacks a secret
+        assert_raises(
+            ValueError, credman.set_many,
+            {'manycred5': dict(secret='s5'), 'manycred6': dict()})
+        eq_(credman.get('manycred5'), None)
+    finally:
+        for i in range(7):
+            credman.remove(f'manycred{i}')
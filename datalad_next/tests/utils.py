@@ -2,6 +2,7 @@ from functools import wraps
 import logging
 from pathlib import Path
 
+from datalad.support.keyring_ import MemoryKeyring
 from datalad.utils import optional_args
 from datalad.tests.utils_pytest import (
     SkipTest,
@@ -132,3 +133,14 @@ def with_credential(name, **kwargs):
 
         return _with_credential
     return with_credential_decorator
+
+
+class CountingKeyring(MemoryKeyring):
+    """In-memory keyring that counts the number of `get()` calls"""
+    def __init__(self):
+        super().__init__()
+        self.get_calls = 0
+
+    def get(self, name, field):
+        self.get_calls += 1
+        return super().get(name, field)
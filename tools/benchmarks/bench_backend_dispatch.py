@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Benchmark the per-request dispatch cost of the backend protocol
+
+`Protocol.command()` is called with a large number of request lines, as
+sent by git-annex, against a backend that does no work. The current
+implementation is compared to the legacy implementation (per-request
+whitespace stripping, splitting, and method lookup via ``getattr()``), which
+is replicated here verbatim for reference. Both variants call the same
+request handlers.
+
+Example::
+
+    python tools/benchmarks/bench_backend_dispatch.py --lines 100000
+"""
+
+import argparse
+
+from bench_backend_protocol import NullBackend
+from benchutils import (
+    summarize,
+    timeit,
+    write_report,
+)
+
+from datalad_next.backend.base import (
+    Protocol,
+    ProtocolError,
+    UnsupportedRequest,
+)
+
+
+class LegacyProtocol(Protocol):
+    """Protocol with the previous per-request dispatch implementation"""
+    def command(self, line):
+        line = line.strip()
+        if not line:
+            raise ProtocolError("Got empty line")
+        parts = line.split(" ", 1)
+
+        method = self.lookupMethod(parts[0])
+        if method is None:
+            raise UnsupportedRequest(f'Unknown request {line!r}')
+
+        try:
+            if len(parts) == 1:
+                reply = method()
+            else:
+                reply = method(parts[1])
+        except TypeError as e:
+            raise SyntaxError(e)
+        else:
+            return reply
+
+    def lookupMethod(self, command):
+        return getattr(self, 'do_' + command.upper(), None)
+
+
+def dispatch(protocol, lines):
+    command = protocol.command
+    for line in lines:
+        command(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--lines', type=int, default=100000,
+        help='number of request lines to dispatch, half GENKEY and half '
+        'VERIFYKEYCONTENT')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of timed repetitions')
+    parser.add_argument(
+        '-o', '--output',
+        help='file to write the JSON report to (default: stdout)')
+    args = parser.parse_args()
+
+    lines = []
+    for i in range(args.lines // 2):
+        path = f'/tmp/annex/.git/annex/othertmp/file{i} with space'
+        lines.append(f'GENKEY {path}')
+        lines.append(f'VERIFYKEYCONTENT XNULL--null {path}')
+
+    results = []
+    for label, protocol_cls in (
+            ('legacy', LegacyProtocol),
+            ('current', Protocol)):
+        protocol = protocol_cls(NullBackend(None))
+        times = timeit(
+            lambda: dispatch(protocol, lines),
+            repeat=args.repeat,
+        )
+        results.append(summarize(
+            f'dispatch-{label}',
+            times,
+            per_line=min(times) / len(lines),
+        ))
+    results[-1]['speedup'] = results[0]['min'] / results[-1]['min']
+
+    write_report(
+        'backend-dispatch',
+        dict(lines=len(lines), repeat=args.repeat),
+        results,
+        args.output,
+    )
+
+
+if __name__ == '__main__':
+    main()
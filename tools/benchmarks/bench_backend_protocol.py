@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""Benchmark the external git-annex backend protocol implementation
+
+A transcript of git-annex requests is replayed against a backend via
+`datalad_next.backend.base.Master.Listen()`, using in-memory streams for
+input and output. This isolates the overhead of request parsing, dispatch,
+and reply writing from any I/O with git-annex.
+
+The following is reported for each replay:
+
+- total time, and requests per second
+- per-request latency percentiles (time between reading a request and
+  flushing its reply)
+- memory allocations during a separate replay under ``tracemalloc``
+
+A transcript is a text file with one request per line, exactly as sent by
+git-annex (e.g. ``GENKEY <path>``, ``VERIFYKEYCONTENT <key> <path>``). It can
+be recorded by putting a wrapper script named ``git-annex-backend-<NAME>`` in
+the ``PATH`` that ``tee``'s its input into a file before passing it on to the
+actual backend. If no transcript is given, a synthetic one is generated for
+a configurable number of (small) files.
+
+The backend is either ``null`` (a backend that does no work at all, to
+measure the protocol overhead only), one of the backends shipped with
+datalad-next (``xdlra``, ``blake2b``), or any ``Backend`` subclass given as
+``<module>:<class>``.
+
+Example::
+
+    python tools/benchmarks/bench_backend_protocol.py \\
+        --backend null --files 5000 -o results.json
+"""
+
+import argparse
+import importlib
+import io
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchutils import (
+    summarize,
+    write_report,
+)
+
+from datalad_next.backend.base import (
+    Backend,
+    Master,
+)
+
+known_backends = {
+    'xdlra': 'datalad_next.backend.xdlra:DataladRepoAnnexBackend',
+    'blake2b': 'datalad_next.backend.blake2b:Blake2bBackend',
+}
+
+
+class NullBackend(Backend):
+    """Backend that does no work, to measure protocol overhead only"""
+    def can_verify(self):
+        return True
+
+    def is_stable(self):
+        return True
+
+    def is_cryptographically_secure(self):
+        return False
+
+    def gen_key(self, local_file):
+        return 'XNULL--null'
+
+    def verify_content(self, key, content_file):
+        return True
+
+
+class TimedInput(io.StringIO):
+    """Records the time at which each request line was read"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = None
+        self.latencies = []
+
+    def readline(self, *args):
+        self.pending = time.perf_counter()
+        return super().readline(*args)
+
+
+class TimedOutput(io.StringIO):
+    """Records the latency of the first flush following a request"""
+    def __init__(self, timed_input):
+        super().__init__()
+        self.timed_input = timed_input
+
+    def flush(self):
+        start = self.timed_input.pending
+        if start is not None:
+            self.timed_input.latencies.append(time.perf_counter() - start)
+            self.timed_input.pending = None
+        super().flush()
+
+
+def get_backend_class(spec):
+    if spec == 'null':
+        return NullBackend
+    modname, clsname = known_backends.get(spec, spec).split(':')
+    return getattr(importlib.import_module(modname), clsname)
+
+
+def make_transcript(path, nfiles, backend_cls):
+    """Generate files, and a transcript of requests regarding them
+
+    The file content is a minimal refs list, such that it is compatible with
+    any supported backend. Keys for the VERIFYKEYCONTENT requests are
+    generated by the backend itself.
+    """
+    files = []
+    for i in range(nfiles):
+        fpath = path / f'file{i}'
+        fpath.write_text(f'{i:040x} HEAD\n')
+        files.append(fpath)
+    requests = [
+        'GETVERSION',
+        'CANVERIFY',
+        'ISSTABLE',
+        'ISCRYPTOGRAPHICALLYSECURE',
+    ]
+    requests.extend(f'GENKEY {f}' for f in files)
+    output = replay('\n'.join(requests) + '\n', backend_cls)[0]
+    keys = [
+        line.split(' ', 1)[1]
+        for line in output.splitlines()
+        if line.startswith('GENKEY-SUCCESS ')
+    ]
+    requests.extend(
+        f'VERIFYKEYCONTENT {k} {f}' for k, f in zip(keys, files))
+    return '\n'.join(requests) + '\n'
+
+
+def replay(transcript, backend_cls):
+    """Replay a transcript, returns output, total time, and latencies"""
+    timed_input = TimedInput(transcript)
+    output = TimedOutput(timed_input)
+    master = Master(output=output)
+    master.LinkBackend(backend_cls(master))
+    start = time.perf_counter()
+    master.Listen(timed_input)
+    duration = time.perf_counter() - start
+    return output.getvalue(), duration, timed_input.latencies
+
+
+def replay_traced(transcript, backend_cls):
+    """Replay a transcript, returns allocation statistics"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        replay(transcript, backend_cls)
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    return dict(
+        tracemalloc_peak_bytes=peak,
+        # net change of allocated memory blocks and size, i.e. what was
+        # not released after the replay
+        tracemalloc_net_blocks=sum(d.count_diff for d in diff),
+        tracemalloc_net_bytes=sum(d.size_diff for d in diff),
+    )
+
+
+def percentile(sorted_values, p):
+    return sorted_values[
+        min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--backend', default='null',
+        help="backend to replay the transcript against: 'null', "
+        "{}, or '<module>:<class>'".format(
+            ', '.join(repr(b) for b in known_backends)))
+    parser.add_argument(
+        '--transcript',
+        help='file with git-annex requests, one per line. If not given, '
+        'a synthetic transcript is generated')
+    parser.add_argument(
+        '--files', type=int, default=2000,
+        help='number of files in a synthetic transcript, each file yields '
+        'a GENKEY and a VERIFYKEYCONTENT request')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of timed replays')
+    parser.add_argument(
+        '-o', '--output',
+        help='file to write the JSON report to (default: stdout)')
+    args = parser.parse_args()
+
+    backend_cls = get_backend_class(args.backend)
+    with tempfile.TemporaryDirectory(prefix='backend-bench-') as tmpdir:
+        if args.transcript:
+            transcript = Path(args.transcript).read_text()
+        else:
+            transcript = make_transcript(
+                Path(tmpdir), args.files, backend_cls)
+        nrequests = sum(1 for line in transcript.splitlines() if line)
+
+        times = []
+        latencies = []
+        for i in range(args.repeat):
+            duration, lat = replay(transcript, backend_cls)[1:]
+            times.append(duration)
+            latencies.extend(lat)
+        latencies.sort()
+        allocations = replay_traced(transcript, backend_cls)
+
+    write_report(
+        'backend-protocol',
+        dict(
+            backend=args.backend,
+            transcript=args.transcript,
+            files=None if args.transcript else args.files,
+            repeat=args.repeat,
+        ),
+        [summarize(
+            'replay',
+            times,
+            requests=nrequests,
+            requests_per_second=nrequests / statistics.median(times),
+            latency_p50=percentile(latencies, 50),
+            latency_p90=percentile(latencies, 90),
+            latency_p99=percentile(latencies, 99),
+            latency_max=latencies[-1],
+            **allocations,
+        )],
+        args.output,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""Benchmark CredentialManager with many credentials and a large config
+
+For each number of credentials, a temporary global Git config is populated
+with that many credentials (and optionally any number of unrelated config
+items, as found in repositories with many remotes), and an in-memory keyring
+with their secrets. The following operations are timed:
+
+- ``get(name)``
+- ``query(realm=...)``, which matches a fraction of all credentials
+- ``query(_sortby='last-used')``, and access to the secret of the most
+  recently used credential
+- ``set(name, ...)`` of a changed property
+- ``remove(name)``
+
+For each operation, the number of keyring calls (by method), and the number
+of subprocesses (``git config`` calls) are reported for a single call.
+
+By default, the process-wide caches of the credential manager are cleared
+before each timed call, such that each measurement reflects the first
+lookup in a process, like in a ``datalad push`` or ``datalad clone``.
+The report lists these caches, and any cache that does not exist in the
+benchmarked version of datalad-next as ``n/a``. Likewise, releases without
+``CredentialManager.query_first()`` are benchmarked with ``query()``.
+
+Example::
+
+    python tools/benchmarks/bench_credman.py --credentials 10 100 1000 10000
+"""
+
+import argparse
+from collections import Counter
+import os
+from pathlib import Path
+import subprocess
+import tempfile
+from unittest.mock import patch
+
+from benchutils import (
+    summarize,
+    timeit,
+    write_report,
+)
+
+from datalad.config import ConfigManager
+from datalad.support.keyring_ import MemoryKeyring
+
+from datalad_next import credman as credman_mod
+from datalad_next.credman import CredentialManager
+
+
+class CountingKeyring(MemoryKeyring):
+    """In-memory keyring that counts calls by method"""
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+
+    def get(self, name, field):
+        self.calls['get'] += 1
+        return super().get(name, field)
+
+    def set(self, name, field, value):
+        self.calls['set'] += 1
+        return super().set(name, field, value)
+
+    def delete(self, name, field=None):
+        self.calls['delete'] += 1
+        return super().delete(name, field)
+
+
+class CountingPopen(subprocess.Popen):
+    """Popen that counts its instances"""
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingPopen.count += 1
+        super().__init__(*args, **kwargs)
+
+
+def populate(cfgfile, keyring, ncreds, nrealms, nunrelated):
+    """Write credentials and unrelated items directly into a config file"""
+    lines = []
+    for i in range(ncreds):
+        lines.extend((
+            f'[datalad "credential.cred{i}"]',
+            '\ttype = user_password',
+            f'\tuser = user{i}',
+            f'\trealm = https://realm{i % nrealms}.example.com',
+            f'\tlast-used = 2022-01-01T00:00:{i % 60:02d}.{i:06d}',
+        ))
+        keyring.set(f'cred{i}', 'secret', f'secret{i}')
+    for i in range(nunrelated):
+        lines.extend((
+            f'[remote "remote{i}"]',
+            f'\turl = https://example.com/repo{i}.git',
+            f'\tfetch = +refs/heads/*:refs/remotes/remote{i}/*',
+        ))
+    cfgfile.write_text('\n'.join(lines) + '\n')
+
+
+# process-wide caches, not all releases have them
+CACHES = {
+    name: getattr(credman_mod, name, None)
+    for name in ('_keyring_cache', '_credential_props_cache')
+}
+
+
+def clear_caches():
+    for cache in CACHES.values():
+        if cache is not None:
+            cache.clear()
+
+
+def query_first(credman, **kwargs):
+    """Most recently used matching credential with a secret"""
+    if hasattr(credman, 'query_first'):
+        return credman.query_first(_sortby='last-used', **kwargs)
+    # releases without query_first() only report credentials with a secret
+    creds = credman.query(_sortby='last-used', **kwargs)
+    return creds[0] if creds else None
+
+
+def get_operations(cfg, ncreds, nrealms):
+    target = f'cred{ncreds // 2}'
+    counter = iter(range(10 ** 9))
+
+    def get(arg):
+        CredentialManager(cfg).get(target)
+
+    def query_realm(arg):
+        # like the realm-based lookup of a credential on push
+        assert query_first(
+            CredentialManager(cfg),
+            realm=f'https://realm{nrealms // 2}.example.com')
+
+    def query_lastused(arg):
+        assert query_first(CredentialManager(cfg))
+
+    def set_prop(arg):
+        CredentialManager(cfg).set(target, prop=f'value{next(counter)}')
+
+    def setup_remove():
+        name = f'removeme{next(counter)}'
+        CredentialManager(cfg).set(name, secret='dummy', prop='value')
+        clear_caches()
+        return name
+
+    def remove(name):
+        CredentialManager(cfg).remove(name)
+
+    return [
+        ('get', get, clear_caches),
+        ('query-realm', query_realm, clear_caches),
+        ('query-last-used', query_lastused, clear_caches),
+        ('set', set_prop, clear_caches),
+        ('remove', remove, setup_remove),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--credentials', type=int, nargs='+', default=[10, 100, 1000],
+        help='numbers of credentials to benchmark with')
+    parser.add_argument(
+        '--realms', type=int, default=10,
+        help='number of distinct realms the credentials are spread across')
+    parser.add_argument(
+        '--unrelated', type=int, default=0,
+        help='number of unrelated remotes (3 config items each) in the '
+        'config')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of timed calls per operation')
+    parser.add_argument(
+        '--warm', action='store_true',
+        help='do not clear the process-wide caches before each timed call')
+    parser.add_argument(
+        '-o', '--output',
+        help='file to write the JSON report to (default: stdout)')
+    args = parser.parse_args()
+
+    results = []
+    for ncreds in args.credentials:
+        with tempfile.TemporaryDirectory(prefix='credman-bench-') as tmpdir:
+            cfgfile = Path(tmpdir) / 'gitconfig'
+            keyring = CountingKeyring()
+            populate(cfgfile, keyring, ncreds, args.realms, args.unrelated)
+            with patch.dict(os.environ, {
+                    'GIT_CONFIG_GLOBAL': str(cfgfile),
+                    'DATALAD_LOCATIONS_LOCKS': str(Path(tmpdir) / 'locks'),
+                    }), \
+                    patch('datalad.support.keyring_.keyring', keyring), \
+                    patch('datalad.runner.nonasyncrunner.Popen',
+                          CountingPopen):
+                cfg = ConfigManager()
+                # one untimed query, such that one-time costs (e.g., legacy
+                # provider discovery) do not end up in the first operation
+                list(CredentialManager(cfg).query_())
+                for label, func, setup in get_operations(
+                        cfg, ncreds, args.realms):
+                    # counts for a single call
+                    arg = setup()
+                    keyring.calls.clear()
+                    CountingPopen.count = 0
+                    func(arg)
+                    calls = dict(keyring.calls)
+                    nprocs = CountingPopen.count
+                    times = timeit(
+                        func,
+                        repeat=args.repeat,
+                        setup=(lambda: None)
+                        if args.warm and label != 'remove'
+                        else setup,
+                    )
+                    results.append(summarize(
+                        f'{label}-{ncreds}',
+                        times,
+                        operation=label,
+                        credentials=ncreds,
+                        keyring_calls=calls,
+                        subprocesses=nprocs,
+                    ))
+
+    write_report(
+        'credman',
+        dict(
+            credentials=args.credentials,
+            realms=args.realms,
+            unrelated=args.unrelated,
+            repeat=args.repeat,
+            warm=args.warm,
+            caches={
+                name: 'n/a' if cache is None
+                else 'kept' if args.warm else 'cleared'
+                for name, cache in CACHES.items()
+            },
+        ),
+        results,
+        args.output,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Benchmark the startup cost of a credential lookup
+
+Each repetition runs a fresh Python process that imports
+`datalad_next.credman`, and retrieves a credential of a known type via
+`CredentialManager.get()`, as done by ``datalad credentials get``. The
+credential is defined via environment variables, and a null keyring backend
+is used, such that no secret store is involved.
+
+The credential type specification is either taken from the static table of
+known credential types (current implementation), or determined by
+introspection of the legacy credential types in ``datalad.downloaders``
+(previous implementation). For reference, the time it takes to import
+``datalad.downloaders`` on its own is reported too.
+
+The following is reported for each variant:
+
+- total time of the process
+- time of the ``datalad_next.credman`` import
+- time of the credential lookup
+- the ``datalad.downloaders`` modules that were imported by the
+  ``datalad_next.credman`` import, and by the lookup
+
+Note that importing ``datalad_next`` itself imports parts of the
+``datalad.downloaders`` package, because patched datalad-core modules import
+``datalad.downloaders.credentials`` and ``datalad.downloaders.http``. The
+costly ``datalad.downloaders.providers`` module is not imported.
+
+Example::
+
+    python tools/benchmarks/bench_credman_import.py --repeat 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchutils import (
+    summarize,
+    write_report,
+)
+
+LOOKUP_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import datalad_next.credman as credman
+imported = time.perf_counter()
+import_imports = sorted(
+    m for m in sys.modules if m.startswith('datalad.downloaders'))
+if {introspect}:
+    # force the previous behavior
+    credman._credential_types = credman._CredentialTypes({{}})
+before = set(sys.modules)
+cred = credman.CredentialManager().get('bench', type='user_password')
+assert cred['secret'] == 'dummy'
+done = time.perf_counter()
+print(json.dumps(dict(
+    import_time=imported - start,
+    lookup_time=done - imported,
+    import_imports=import_imports,
+    lookup_imports=sorted(
+        m for m in set(sys.modules) - before
+        if m.startswith('datalad.downloaders')),
+)))
+"""
+
+DOWNLOADERS_SCRIPT = """
+import json
+import time
+import datalad.config
+start = time.perf_counter()
+import datalad.downloaders.providers
+print(json.dumps(dict(import_time=time.perf_counter() - start)))
+"""
+
+
+def run(script):
+    env = dict(
+        os.environ,
+        DATALAD_CREDENTIAL_BENCH_SECRET='dummy',
+        DATALAD_CREDENTIAL_BENCH_USER='bench',
+        PYTHON_KEYRING_BACKEND='keyring.backends.null.Keyring',
+    )
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, '-c', script],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    duration = time.perf_counter() - start
+    return duration, json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of timed processes per variant')
+    parser.add_argument(
+        '-o', '--output',
+        help='file to write the JSON report to (default: stdout)')
+    args = parser.parse_args()
+
+    results = []
+    for label, introspect in (
+            ('introspection', True),
+            ('static', False)):
+        times = []
+        records = []
+        for i in range(args.repeat):
+            duration, rec = run(LOOKUP_SCRIPT.format(introspect=introspect))
+            times.append(duration)
+            records.append(rec)
+        results.append(summarize(
+            f'lookup-{label}',
+            times,
+            import_time=min(r['import_time'] for r in records),
+            lookup_time=min(r['lookup_time'] for r in records),
+            import_imports=records[-1]['import_imports'],
+            lookup_imports=records[-1]['lookup_imports'],
+        ))
+    results[-1]['lookup_speedup'] = \
+        results[0]['lookup_time'] / results[-1]['lookup_time']
+
+    records = [run(DOWNLOADERS_SCRIPT)[1] for i in range(args.repeat)]
+    results.append(summarize(
+        'import-downloaders',
+        [r['import_time'] for r in records],
+    ))
+
+    write_report(
+        'credman-import',
+        dict(repeat=args.repeat),
+        results,
+        args.output,
+    )
+
+
+if __name__ == '__main__':
+    main()
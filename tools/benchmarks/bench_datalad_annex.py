@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""Benchmark clone, fetch, and push via `git-remote-datalad-annex`
+
+A synthetic repository of configurable size (number of commits, number of
+refs, blob size) is generated, and pushed to/cloned from a `datalad-annex::`
+remote. The following operations are timed:
+
+- ``push-initial``: push all refs to an empty remote
+- ``clone``: clone from the remote into a fresh location
+- ``fetch-noop``: fetch from an unchanged remote into an up-to-date clone
+- ``push-small``: push a single new commit with a small change
+- ``push-large``: push a single new commit with a large blob
+
+Two remote types are supported: a local ``directory`` special remote, and a
+``webdav`` special remote served by the in-process WebDAV server used by the
+test suite (requires ``cheroot`` and ``wsgidav``).
+
+Results are reported as a JSON document (see ``benchutils``).
+
+Example::
+
+    python tools/benchmarks/bench_datalad_annex.py \\
+        --commits 1000 --refs 50 --blob-size 4096 -o results.json
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from benchutils import (
+    summarize,
+    timeit,
+    write_report,
+)
+
+webdav_auth = ('datalad', 'secure')
+
+
+def run_git(args, cwd, env=None):
+    subprocess.run(
+        ['git'] + args,
+        cwd=str(cwd),
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def make_repo(path, commits, refs, blob_size, files_per_commit):
+    """Generate a synthetic repository via git-fast-import
+
+    Each commit modifies `files_per_commit` files with random content of
+    `blob_size` bytes each. Besides the main branch, `refs - 1` additional
+    branches are created, pointing to commits spread over the history.
+    """
+    run_git(['init', '-q', str(path)], cwd=path.parent)
+    proc = subprocess.Popen(
+        ['git', 'fast-import', '--quiet'],
+        cwd=str(path),
+        stdin=subprocess.PIPE,
+    )
+    nfiles = max(files_per_commit * 10, 1)
+    fileidx = 0
+    for i in range(commits):
+        modifications = []
+        for j in range(files_per_commit):
+            blob = os.urandom(blob_size)
+            proc.stdin.write(b'blob\nmark :%d\ndata %d\n' % (
+                2 * commits + i * files_per_commit + j + 1, len(blob)))
+            proc.stdin.write(blob)
+            proc.stdin.write(b'\n')
+            modifications.append(b'M 100644 :%d d%d/f%d\n' % (
+                2 * commits + i * files_per_commit + j + 1,
+                fileidx % 100, fileidx % nfiles))
+            fileidx += 1
+        msg = b'commit %d' % i
+        proc.stdin.write(b'commit refs/heads/main\nmark :%d\n' % (i + 1))
+        proc.stdin.write(
+            b'committer Bench <bench@example.com> %d +0000\n' % (
+                1600000000 + i))
+        proc.stdin.write(b'data %d\n%s\n' % (len(msg), msg))
+        if i:
+            proc.stdin.write(b'from :%d\n' % i)
+        proc.stdin.writelines(modifications)
+        proc.stdin.write(b'\n')
+    for k in range(refs - 1):
+        proc.stdin.write(b'reset refs/heads/branch%d\nfrom :%d\n\n' % (
+            k, (k * commits) // max(refs - 1, 1) + 1))
+    proc.stdin.close()
+    if proc.wait():
+        raise RuntimeError('git-fast-import failed')
+    run_git(['symbolic-ref', 'HEAD', 'refs/heads/main'], cwd=path)
+    run_git(['reset', '-q', '--hard'], cwd=path)
+
+
+def add_commit(repo, size, name):
+    (repo / name).write_bytes(os.urandom(size))
+    run_git(['add', name], cwd=repo)
+    run_git(['commit', '-q', '-m', f'update {name}'], cwd=repo)
+
+
+def wipe(path):
+    """Remove all content of a directory, but not the directory itself"""
+    for p in path.iterdir():
+        if p.is_dir():
+            shutil.rmtree(str(p))
+        else:
+            p.unlink()
+
+
+def bench_remote(label, url, remotepath, srcrepo, workdir, args, env):
+    results = []
+    params = dict(remote=label)
+
+    def setup_initial():
+        wipe(remotepath)
+        # also wipe the local state of the remote helper, for a truly
+        # initial push
+        shutil.rmtree(
+            str(srcrepo / '.git' / 'dl-repoannex'), ignore_errors=True)
+
+    results.append(summarize(
+        'push-initial',
+        timeit(
+            lambda *a: run_git(['push', '-q', 'dla', '--all'], srcrepo, env),
+            repeat=args.repeat,
+            setup=setup_initial,
+        ),
+        **params))
+
+    clones = []
+
+    def setup_clone():
+        clonepath = workdir / f'clone-{label}-{len(clones)}'
+        clones.append(clonepath)
+        return clonepath
+
+    results.append(summarize(
+        'clone',
+        timeit(
+            lambda p: run_git(['clone', '-q', url, str(p)], workdir, env),
+            repeat=args.repeat,
+            setup=setup_clone,
+        ),
+        **params))
+
+    results.append(summarize(
+        'fetch-noop',
+        timeit(
+            lambda *a: run_git(['fetch', '-q', 'origin'], clones[0], env),
+            repeat=args.repeat,
+        ),
+        **params))
+
+    for name, size in (
+            ('push-small', 100),
+            ('push-large', args.large_blob_size)):
+        results.append(summarize(
+            name,
+            timeit(
+                lambda *a: run_git(['push', '-q', 'dla', 'main'],
+                                   srcrepo, env),
+                repeat=args.repeat,
+                setup=lambda: add_commit(srcrepo, size, name),
+            ),
+            blob_size=size,
+            **params))
+    for c in clones:
+        shutil.rmtree(str(c), ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--commits', type=int, default=100,
+        help='number of commits in the synthetic repository')
+    parser.add_argument(
+        '--refs', type=int, default=10,
+        help='number of refs (branches) in the synthetic repository')
+    parser.add_argument(
+        '--blob-size', type=int, default=1024,
+        help='size of each file modification in bytes')
+    parser.add_argument(
+        '--files-per-commit', type=int, default=1,
+        help='number of files modified in each commit')
+    parser.add_argument(
+        '--large-blob-size', type=int, default=50 * 1024 * 1024,
+        help='size of the blob in the large push in bytes')
+    parser.add_argument(
+        '--remote', choices=('directory', 'webdav', 'all'), default='all',
+        help='special remote type(s) to benchmark')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of timed repetitions of each operation')
+    parser.add_argument(
+        '-o', '--output',
+        help='file to write the JSON report to (default: stdout)')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='dla-bench-') as tmpdir:
+        workdir = Path(tmpdir)
+        srcrepo = workdir / 'src'
+        srcrepo.mkdir()
+        make_repo(srcrepo, args.commits, args.refs, args.blob_size,
+                  args.files_per_commit)
+
+        if args.remote in ('directory', 'all'):
+            remotepath = workdir / 'directory-remote'
+            remotepath.mkdir()
+            url = f'datalad-annex::?type=directory&directory={remotepath}' \
+                  '&encryption=none'
+            run_git(['remote', 'add', 'dla', url], srcrepo)
+            results.extend(bench_remote(
+                'directory', url, remotepath, srcrepo, workdir, args,
+                os.environ.copy()))
+            run_git(['remote', 'remove', 'dla'], srcrepo)
+            shutil.rmtree(
+                str(srcrepo / '.git' / 'dl-repoannex'), ignore_errors=True)
+
+        if args.remote in ('webdav', 'all'):
+            from datalad_next.tests.utils import WebDAVPath
+            remotepath = workdir / 'webdav-remote'
+            with WebDAVPath(remotepath, auth=webdav_auth) as webdavurl:
+                url = f'datalad-annex::{webdavurl}' \
+                      '?type=webdav&url={noquery}&encryption=none'
+                run_git(['remote', 'add', 'dla', url], srcrepo)
+                env = dict(
+                    os.environ,
+                    WEBDAV_USERNAME=webdav_auth[0],
+                    WEBDAV_PASSWORD=webdav_auth[1],
+                )
+                results.extend(bench_remote(
+                    'webdav', url, remotepath, srcrepo, workdir, args, env))
+                run_git(['remote', 'remove', 'dla'], srcrepo)
+
+    write_report(
+        'datalad-annex',
+        dict(
+            commits=args.commits,
+            refs=args.refs,
+            blob_size=args.blob_size,
+            files_per_commit=args.files_per_commit,
+            large_blob_size=args.large_blob_size,
+            repeat=args.repeat,
+        ),
+        results,
+        args.output,
+    )
+
+
+if __name__ == '__main__':
+    main()
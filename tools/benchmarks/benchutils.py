@@ -0,0 +1,137 @@
+"""Shared helpers for the benchmark scripts in this directory
+
+All benchmark scripts report a JSON document of the same structure, in order
+to be able to track results across releases::
+
+    {
+      "suite": "<name of the benchmark script>",
+      "environment": {...},
+      "parameters": {...},
+      "results": [
+        {"name": "<benchmark>", "times": [...], "min": ..., "median": ...,
+         ...},
+        ...
+      ]
+    }
+
+All times are in seconds.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+
+def get_environment_info():
+    """Return a mapping with versions of all relevant software components"""
+    info = dict(
+        timestamp=datetime.now().isoformat(),
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+    )
+    for label, cmd in (
+            ('git', ['git', '--version']),
+            ('git-annex', ['git', 'annex', 'version', '--raw'])):
+        try:
+            info[label] = subprocess.run(
+                cmd, capture_output=True, text=True,
+                check=True).stdout.strip().split()[-1]
+        except (OSError, subprocess.CalledProcessError):
+            info[label] = None
+    try:
+        import datalad
+        info['datalad'] = datalad.__version__
+        import datalad_next
+        info['datalad_next'] = datalad_next.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def summarize(name, times, **kwargs):
+    """Build a result record from a list of timings
+
+    Parameters
+    ----------
+    name: str
+      Benchmark name.
+    times: list(float)
+      Individual timings in seconds.
+    **kwargs:
+      Any additional properties to include in the record.
+
+    Returns
+    -------
+    dict
+    """
+    rec = dict(
+        name=name,
+        times=times,
+        min=min(times),
+        median=statistics.median(times),
+        max=max(times),
+    )
+    rec.update(kwargs)
+    return rec
+
+
+def timeit(func, repeat=1, setup=None):
+    """Time a function call
+
+    Parameters
+    ----------
+    func: callable
+      Called without arguments. Receives the return value of `setup`, if
+      a `setup` callable is given.
+    repeat: int, optional
+      Number of timed calls.
+    setup: callable, optional
+      Called (untimed) before each timed call.
+
+    Returns
+    -------
+    list(float)
+    """
+    times = []
+    for i in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def write_report(suite, parameters, results, output=None):
+    """Write a JSON benchmark report
+
+    Parameters
+    ----------
+    suite: str
+      Name of the benchmark suite.
+    parameters: dict
+      Parameterization of the benchmark run.
+    results: list(dict)
+      Result records, as produced by `summarize()`.
+    output: str, optional
+      Path of the file to write the report to. If not given, the report
+      is written to stdout.
+    """
+    report = json.dumps(
+        dict(
+            suite=suite,
+            environment=get_environment_info(),
+            parameters=parameters,
+            results=results,
+        ),
+        indent=2,
+    )
+    if output:
+        with open(output, 'w') as f:
+            f.write(report)
+            f.write('\n')
+    else:
+        print(report)